@@ -0,0 +1,52 @@
+"""
+Compares downloading content via the JSON endpoint against the raw data endpoint.
+Run against a live server, e.g. `python benchmarks/content_download.py http://localhost:8000 furniture 1`.
+"""
+
+import asyncio
+import base64
+import sys
+import time
+
+import httpx
+
+REQUESTS = 200
+CONCURRENCY = 16
+
+
+async def run(client: httpx.AsyncClient, url: str, decode: bool) -> tuple[float, int]:
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    transferred = 0
+
+    async def fetch():
+        nonlocal transferred
+        async with semaphore:
+            response = await client.get(url)
+            response.raise_for_status()
+            if decode:
+                data = base64.b64decode(response.json()["content"]["data"])
+            else:
+                data = response.content
+            transferred += len(data)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[fetch() for _ in range(REQUESTS)])
+    return time.perf_counter() - start, transferred
+
+
+async def main(host: str, project: str, contentid: int):
+    async with httpx.AsyncClient(base_url=host, timeout=60) as client:
+        for name, url, decode in (
+            ("json", f"/v1/content/{project}/{contentid}", True),
+            ("data", f"/v1/content/{project}/{contentid}/data", False),
+        ):
+            await run(client, url, decode)
+            elapsed, transferred = await run(client, url, decode)
+            print(
+                f"{name}: {REQUESTS / elapsed:.1f} req/s, "
+                f"{transferred / elapsed / 1024 / 1024:.1f} MB/s"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1], sys.argv[2], int(sys.argv[3])))
@@ -0,0 +1,139 @@
+"""
+Compares the latency and output size of normalizing uploaded images in ImageValidator.
+Run with `python -m benchmarks.image_normalization [corpus]`, where the corpus is a directory of images or a zip bundle,
+e.g. downloaded from `/v2/bundles/mca/all`. Without one, a synthetic corpus of skins and larger textures is used.
+"""
+
+import io
+import os
+import statistics
+import sys
+import time
+import zipfile
+from typing import Callable, Dict, List
+
+import numpy as np
+from PIL import Image
+
+from immersive_library.validators.common.image import ImageValidator
+
+ROUNDS = 5
+
+validator = ImageValidator()
+
+
+def legacy(image: Image.Image) -> bytes:
+    # Copying the pixels as one Python tuple each
+    output = io.BytesIO()
+    image2 = Image.new("RGBA", image.size)
+    # noinspection PyTypeChecker
+    image2.putdata(list(image.getdata()))
+    image2.save(output, format="png")
+    return output.getvalue()
+
+
+def buffer(compress_level: int) -> Callable[[Image.Image], bytes]:
+    def normalize(image: Image.Image) -> bytes:
+        converted = image.convert("RGBA")
+        clean = Image.frombytes("RGBA", converted.size, converted.tobytes())
+        output = io.BytesIO()
+        clean.save(output, format="png", compress_level=compress_level)
+        return output.getvalue()
+
+    return normalize
+
+
+VARIANTS: Dict[str, Callable[[Image.Image], bytes]] = {
+    "legacy": legacy,
+    "buffer, level 1": buffer(1),
+    "buffer, level 6": buffer(6),
+    "buffer, level 9": buffer(9),
+    "validator": validator.normalize,
+}
+
+
+def encode(pixels: np.ndarray) -> bytes:
+    output = io.BytesIO()
+    Image.fromarray(pixels).save(output, format="png")
+    return output.getvalue()
+
+
+def synthetic_corpus() -> List[bytes]:
+    """
+    Pixel art skins with shaded color blocks on the clothing area, and smooth textures
+    """
+    rng = np.random.default_rng(0)
+    mask = np.asarray(
+        Image.open("immersive_library/validators/mca/data/clothing.png").convert("L")
+    )
+
+    corpus = []
+    for _ in range(100):
+        skin = np.zeros((64, 64, 4), np.uint8)
+        blocks = rng.integers(0, 256, (16, 16, 3)).repeat(4, 0).repeat(4, 1)
+        shading = rng.integers(-2, 3, (64, 64, 1)) * 8
+        skin[..., :3] = np.clip(blocks + shading, 0, 255)
+        skin[..., 3] = np.where(mask > 0, 255, 0)
+        corpus.append(encode(skin))
+
+    for size in (256, 512, 1024):
+        y, x = np.mgrid[0:size, 0:size]
+        texture = np.full((size, size, 4), 255, np.uint8)
+        texture[..., 0] = x * 255 // size
+        texture[..., 1] = y * 255 // size
+        texture[..., 2] = (x ^ y) & 255
+        shading = rng.integers(-1, 2, (size, size, 1)) * 6
+        texture[..., :3] = np.clip(texture[..., :3] + shading, 0, 255) // 4 * 4
+        corpus.append(encode(texture))
+    return corpus
+
+
+def load_corpus(path: str) -> List[bytes]:
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            names = [n for n in archive.namelist() if n.endswith(".png")]
+            return [archive.read(n) for n in names]
+    corpus = []
+    for name in sorted(os.listdir(path)):
+        with open(os.path.join(path, name), "rb") as f:
+            corpus.append(f.read())
+    return corpus
+
+
+def decode(data: bytes) -> Image.Image:
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return image
+
+
+def main(corpus: List[bytes]):
+    images = [decode(data) for data in corpus]
+    groups = {
+        "64x64": [i for i, image in enumerate(images) if image.size == (64, 64)],
+        "larger": [i for i, image in enumerate(images) if image.size != (64, 64)],
+    }
+
+    for group, indices in groups.items():
+        if not indices:
+            continue
+        original = sum(len(corpus[i]) for i in indices) / len(indices)
+        print(f"{len(indices)} images {group}, {original / 1024:.1f} KiB on average")
+        for name, function in VARIANTS.items():
+            latencies = []
+            size = 0
+            for i in indices:
+                best = float("inf")
+                for _ in range(ROUNDS):
+                    start = time.perf_counter()
+                    output = function(images[i])
+                    best = min(best, time.perf_counter() - start)
+                latencies.append(best)
+                size += len(output)
+            print(
+                f"  {name}: {statistics.median(latencies) * 1000:.2f} ms median, "
+                f"{size / len(indices) / 1024:.1f} KiB on average"
+            )
+
+
+if __name__ == "__main__":
+    main(load_corpus(sys.argv[1]) if len(sys.argv) > 1 else synthetic_corpus())
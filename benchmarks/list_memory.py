@@ -0,0 +1,174 @@
+"""
+Compares the peak RSS of serving the deprecated 500 row list under concurrency.
+Run with `python -m benchmarks.list_memory [rows] [concurrency]`, uses a temporary database.
+Each variant runs in a fresh process, as the peak RSS of a process never shrinks.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+
+# Inherited by the spawned processes, which share the database
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/benchmark.db")
+
+import orjson  # noqa: E402
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+from starlette.responses import JSONResponse  # noqa: E402
+
+from immersive_library.api import FastAPIJsonCoder, setup  # noqa: E402
+from immersive_library.common import database  # noqa: E402
+from immersive_library.models import ContentListSuccess  # noqa: E402
+from immersive_library.utils import (  # noqa: E402
+    ALL_JOINS,
+    LITE_CONTENT_FIELDS,
+    encode_contents,
+    get_content_dict,
+    get_lite_content_class,
+    get_select,
+    update_precomputation,
+)
+
+ROUNDS = 20
+
+QUERY = get_select(LITE_CONTENT_FIELDS, ALL_JOINS) + "WHERE c.project = 'benchmark'"
+
+# The page as the cache hands it out
+cached = b""
+
+# The query currently shared by concurrent misses
+inflight: dict[str, asyncio.Task] = {}
+
+
+def respond(page) -> bytes:
+    # FastAPI validating and encoding the response model
+    validated = TypeAdapter(ContentListSuccess).validate_python(page)
+    return JSONResponse(jsonable_encoder(validated, exclude_none=True)).body
+
+
+async def models_miss():
+    # Records, models, the cache coder and the response
+    records = await database.fetch_all(QUERY)
+    page = ContentListSuccess(
+        contents=[get_lite_content_class(r, False, False) for r in records]
+    )
+    FastAPIJsonCoder.encode(page)
+    return respond(page)
+
+
+async def models_hit():
+    # Decoding the cached page only to validate and encode it again
+    return respond(FastAPIJsonCoder.decode(cached))
+
+
+async def records_miss():
+    return encode_contents(await database.fetch_all(QUERY), LITE_CONTENT_FIELDS, False)
+
+
+async def cursor_miss():
+    # Sending each row as it is read, keeping the cursor open meanwhile
+    async def stream():
+        yield b'{"contents":['
+        separator = b""
+        async for r in database.iterate(QUERY):
+            yield separator + orjson.dumps(get_content_dict(r, LITE_CONTENT_FIELDS))
+            separator = b","
+        yield b"]}"
+
+    size = 0
+    async for chunk in stream():
+        size += len(chunk)
+    return size
+
+
+async def coalesced_miss():
+    # Concurrent misses awaiting a single query, as the cache's single flight does
+    if "page" not in inflight:
+        inflight["page"] = asyncio.create_task(records_miss())
+        inflight["page"].add_done_callback(lambda _: inflight.pop("page"))
+    return await inflight["page"]
+
+
+async def raw_hit():
+    return cached
+
+
+VARIANTS = {
+    "models, miss": models_miss,
+    "models, hit": models_hit,
+    "records, miss": records_miss,
+    "cursor, miss": cursor_miss,
+    "coalesced, miss": coalesced_miss,
+    "raw, hit": raw_hit,
+}
+
+
+def max_rss() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+async def run_variant(name: str, concurrency: int, result):
+    global cached
+
+    await database.connect()
+    cached = await records_miss()
+    function = VARIANTS[name]
+
+    # Warm up imports, caches and connections before taking the baseline
+    await function()
+    baseline = max_rss()
+
+    for _ in range(ROUNDS):
+        await asyncio.gather(*[function() for _ in range(concurrency)])
+
+    await database.disconnect()
+    result.value = max_rss() - baseline
+
+
+def worker(name: str, concurrency: int, result):
+    asyncio.run(run_variant(name, concurrency, result))
+
+
+async def populate(rows: int):
+    await database.connect()
+    await setup()
+    await database.execute(
+        "INSERT INTO users (google_userid, username, moderator, banned) VALUES ('', 'benchmark', 0, 0)"
+    )
+    await database.execute_many(
+        "INSERT INTO content (userid, project, title, meta, data) VALUES (1, 'benchmark', :title, '{}', x'00')",
+        [{"title": f"Content {i}"} for i in range(rows)],
+    )
+    await database.execute_many(
+        "INSERT INTO tags (contentid, tag) VALUES (:contentid, :tag)",
+        [
+            {"contentid": i + 1, "tag": tag}
+            for i in range(rows)
+            for tag in ("shirt", "blue", "casual")
+        ],
+    )
+    await update_precomputation(database)
+    await database.disconnect()
+
+
+def main(rows: int, concurrency: int):
+    asyncio.run(populate(rows))
+
+    print(f"{rows} rows, {concurrency} concurrent requests")
+    context = multiprocessing.get_context("spawn")
+    for name in VARIANTS:
+        result = context.Value("q", 0)
+        process = context.Process(target=worker, args=(name, concurrency, result))
+        process.start()
+        process.join()
+        print(f"  {name}: {result.value / 1024:,.1f} MiB peak RSS growth")
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 500,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 16,
+    )
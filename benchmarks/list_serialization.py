@@ -0,0 +1,93 @@
+"""
+Compares serializing a content list page through pydantic against encoding the rows directly.
+Run with `python -m benchmarks.list_serialization [rows]`, uses a temporary database.
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/benchmark.db"
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+from starlette.responses import JSONResponse  # noqa: E402
+
+from immersive_library.api import FastAPIJsonCoder, setup  # noqa: E402
+from immersive_library.common import database  # noqa: E402
+from immersive_library.models import ContentListSuccess  # noqa: E402
+from immersive_library.utils import (  # noqa: E402
+    LIST_FIELDS,
+    LITE_CONTENT_FIELDS,
+    encode_contents,
+    get_base_select,
+    get_lite_content_class,
+    update_precomputation,
+)
+
+ROUNDS = 50
+
+
+def pydantic_path(records, include_meta: bool, parse_meta: bool) -> bytes:
+    # What a cached page used to go through: model construction, the cache coder,
+    # and FastAPI validating and encoding the response model again
+    page = ContentListSuccess(
+        contents=[get_lite_content_class(r, include_meta, parse_meta) for r in records]
+    )
+    decoded = FastAPIJsonCoder.decode(FastAPIJsonCoder.encode(page))
+    validated = TypeAdapter(ContentListSuccess).validate_python(decoded)
+    return JSONResponse(jsonable_encoder(validated, exclude_none=True)).body
+
+
+def direct_path(records, include_meta: bool, parse_meta: bool) -> bytes:
+    fields = LIST_FIELDS if include_meta else LITE_CONTENT_FIELDS
+    return encode_contents(records, fields, parse_meta)
+
+
+def measure(function, records, include_meta: bool, parse_meta: bool):
+    function(records, include_meta, parse_meta)
+
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        function(records, include_meta, parse_meta)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    function(records, include_meta, parse_meta)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return len(records) * ROUNDS / elapsed, peak
+
+
+async def main(rows: int):
+    await database.connect()
+    await setup()
+    await database.execute(
+        "INSERT INTO users (google_userid, username, moderator, banned) VALUES ('', 'benchmark', 0, 0)"
+    )
+    await database.execute_many(
+        "INSERT INTO content (userid, project, title, meta, data) VALUES (1, 'benchmark', :title, :meta, x'00')",
+        [
+            {"title": f"Content {i}", "meta": f'{{"index": {i}, "name": "n{i}"}}'}
+            for i in range(rows)
+        ],
+    )
+    await update_precomputation(database)
+    records = await database.fetch_all(get_base_select(False, True))
+    await database.disconnect()
+
+    for include_meta, parse_meta in ((False, False), (True, False), (True, True)):
+        print(f"include_meta={include_meta} parse_meta={parse_meta}")
+        for name, function in (("pydantic", pydantic_path), ("direct", direct_path)):
+            rate, peak = measure(function, records, include_meta, parse_meta)
+            print(
+                f"  {name}: {rate:,.0f} rows/s, {peak / 1024:,.0f} KiB peak allocated"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 500))
@@ -9,18 +9,33 @@ from fastapi import FastAPI, HTTPException, Request
 from fastapi.encoders import jsonable_encoder
 from fastapi.openapi.utils import get_openapi
 from fastapi_cache import Coder, FastAPICache
-from fastapi_cache.backends.redis import RedisBackend
 from prometheus_fastapi_instrumentator import Instrumentator
 from redis import asyncio as aioredis
-from starlette.middleware.gzip import GZipMiddleware
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder
 from starlette.responses import JSONResponse
 from starlette.staticfiles import StaticFiles
 
+from immersive_library import bundles as bundle_builder
+from immersive_library import changes as change_log
+from immersive_library import events as event_relay
+from immersive_library import snapshots, warmup
+from immersive_library.caching import (
+    CacheBackend,
+    ResilientBackend,
+    canonical_key_builder,
+)
 from immersive_library.common import database
+from immersive_library.id_tokens import id_token_verifier
 from immersive_library.routers import (
     auth,
+    bundles,
+    changes,
     content,
+    events,
+    export,
     like,
+    manifest,
     misc,
     report,
     tag,
@@ -32,6 +47,9 @@ from immersive_library.routers.deprecated import content as deprecated_content
 from immersive_library.routers.deprecated import user as deprecated_user
 from immersive_library.utils import update_precomputation
 
+# Seconds a Redis call may take before the cache counts it as failed
+REDIS_TIMEOUT = float(os.getenv("REDIS_TIMEOUT", "0.5"))
+
 description = """
 A simple and generic user asset library.
 """
@@ -91,20 +109,95 @@ async def lifespan(_app: FastAPI):
         "redis://"
         + os.getenv("REDIS_HOST", "localhost")
         + ":"
-        + os.getenv("REDIS_PORT", "6379")
+        + os.getenv("REDIS_PORT", "6379"),
+        socket_timeout=REDIS_TIMEOUT,
+        socket_connect_timeout=REDIS_TIMEOUT,
     )
+    backend = ResilientBackend(CacheBackend(redis))
     FastAPICache.init(
-        RedisBackend(redis), prefix="immersive-library", coder=FastAPIJsonCoder
+        backend,
+        prefix="immersive-library",
+        coder=FastAPIJsonCoder,
+        key_builder=canonical_key_builder,
     )
 
+    # Fall back to an in-process cache while Redis is down, and reconnect in the background
+    backend_task = asyncio.create_task(backend.run())
+
+    # Keep Google's signing keys fresh so logins never wait on a fetch
+    verifier_task = asyncio.create_task(id_token_verifier.run())
+
+    # Precompute the expensive aggregates before traffic finds them cold
+    warmup_task = asyncio.create_task(warmup.run())
+
+    # Drop superseded change log entries and expired tombstones
+    changes_task = asyncio.create_task(change_log.run())
+
+    # Rebuild the downloadable archives once their project changed
+    bundles_task = asyncio.create_task(bundle_builder.run())
+
+    # Pre-render the deprecated content list for legacy clients
+    snapshots_task = asyncio.create_task(snapshots.run())
+
+    # Relay content changes from all workers to this worker's event streams
+    events_task = asyncio.create_task(event_relay.run())
+
     yield
 
+    events_task.cancel()
+    snapshots_task.cancel()
+    bundles_task.cancel()
+    changes_task.cancel()
+    warmup_task.cancel()
+    verifier_task.cancel()
+    backend_task.cancel()
+
     await database.disconnect()
 
 
+# Already compressed formats, gzipping them again only burns CPU
+INCOMPRESSIBLE_CONTENT_TYPES = (
+    "image/png",
+    "image/jpeg",
+    "image/gif",
+    "application/gzip",
+    "application/zip",
+    "application/x-tar",
+)
+
+
+class SelectiveGZipResponder(GZipResponder):
+    async def send_with_compression(self, message):
+        await super().send_with_compression(message)
+        if message["type"] == "http.response.start":
+            content_type = Headers(raw=message["headers"]).get("content-type", "")
+            # Partial responses must keep their byte offsets intact
+            if message["status"] == 206 or content_type.startswith(
+                INCOMPRESSIBLE_CONTENT_TYPES
+            ):
+                self.content_type_is_excluded = True
+
+
+class SelectiveGZipMiddleware(GZipMiddleware):
+    """
+    Like GZipMiddleware, but passes already compressed content through untouched.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and "gzip" in Headers(scope=scope).get(
+            "Accept-Encoding", ""
+        ):
+            responder = SelectiveGZipResponder(
+                self.app, self.minimum_size, compresslevel=self.compresslevel
+            )
+            await responder(scope, receive, send)
+        else:
+            await super().__call__(scope, receive, send)
+
+
 app = FastAPI(lifespan=lifespan)
 
-app.add_middleware(GZipMiddleware, minimum_size=4096, compresslevel=6)
+app.add_middleware(SelectiveGZipMiddleware, minimum_size=4096, compresslevel=6)
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -142,6 +235,7 @@ async def validation_exception_handler(request: Request, exc: HTTPException):
     return JSONResponse(
         status_code=exc.status_code,
         content={"message": exc.detail},
+        headers=exc.headers,
     )
 
 
@@ -212,6 +306,19 @@ async def setup():
         "CREATE INDEX IF NOT EXISTS content_userid on content (userid)"
     )
 
+    # Canonicalize meta uploaded before it has been validated
+    # TODO: Remove after a while
+    if (await database.fetch_val("PRAGMA user_version")) < 1:
+        await database.execute("""
+            UPDATE content
+            SET meta = '{}'
+            WHERE CASE WHEN json_valid(meta) THEN json_type(meta) != 'object' ELSE 1 END
+        """)
+        await database.execute(
+            "UPDATE content SET meta = json(meta) WHERE meta != json(meta)"
+        )
+        await database.execute("PRAGMA user_version = 1")
+
     # Reports
     await database.execute("""
         CREATE TABLE IF NOT EXISTS reports (
@@ -244,6 +351,9 @@ async def setup():
         "CREATE INDEX IF NOT EXISTS tags_contentid on tags (contentid)"
     )
 
+    # Change log
+    await change_log.setup_changes()
+
     # Precomputation
     await database.execute("""
         CREATE TABLE IF NOT EXISTS precomputation (
@@ -263,8 +373,13 @@ app.include_router(deprecated_user.router)
 
 # Latest routes
 app.include_router(auth.router)
+app.include_router(bundles.router)
+app.include_router(changes.router)
 app.include_router(content.router)
+app.include_router(events.router)
+app.include_router(export.router)
 app.include_router(like.router)
+app.include_router(manifest.router)
 app.include_router(misc.router)
 app.include_router(report.router)
 app.include_router(tag.router)
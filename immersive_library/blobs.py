@@ -0,0 +1,143 @@
+import sqlite3
+from contextlib import contextmanager
+from typing import Optional
+
+from immersive_library.common import database
+
+MEDIA_TYPES = {
+    b"\x89PNG\r\n\x1a\n": "image/png",
+    b"\xff\xd8\xff": "image/jpeg",
+    b"GIF8": "image/gif",
+    b"\x1f\x8b": "application/gzip",
+}
+
+
+class ContentChangedError(Exception):
+    """
+    The content changed or disappeared while its data was being read
+    """
+
+
+def get_media_type(header: bytes) -> str:
+    """
+    Guesses the media type from the first bytes of a blob
+    """
+    for magic, media_type in MEDIA_TYPES.items():
+        if header.startswith(magic):
+            return media_type
+    return "application/octet-stream"
+
+
+@contextmanager
+def read_transaction(connection: sqlite3.Connection):
+    """
+    Holds a SHARED lock for the duration, so all reads see the same state
+    """
+    connection.execute("BEGIN")
+    try:
+        yield
+    finally:
+        connection.execute("COMMIT")
+
+
+def get_version(connection: sqlite3.Connection, project: str, contentid: int):
+    row = connection.execute(
+        "SELECT version FROM content WHERE oid=? AND project=? AND data IS NOT NULL",
+        (contentid, project),
+    ).fetchone()
+    return None if row is None else row[0]
+
+
+class ContentBlob:
+    def __init__(
+        self,
+        connection: Optional[sqlite3.Connection],
+        project: str,
+        contentid: int,
+        version: int,
+        size: int,
+        header: bytes,
+        data: Optional[bytes] = None,
+    ):
+        """
+        A read-only handle on a content's data, to be used from worker threads.
+        :param connection: The dedicated connection for incremental reads, None if the data has been read already.
+        :param version: The content version at the time the blob has been opened.
+        :param data: The whole data, if small enough to be read right away.
+        """
+        self.connection = connection
+        self.project = project
+        self.contentid = contentid
+        self.version = version
+        self.size = size
+        self.media_type = get_media_type(header)
+        self.data = data
+
+    def read(self, offset: int, length: int) -> bytes:
+        """
+        Reads a chunk in its own short read transaction, so no lock is held in between
+        """
+        if self.data is not None:
+            return self.data[offset : offset + length]
+        with read_transaction(self.connection):
+            if (
+                get_version(self.connection, self.project, self.contentid)
+                != self.version
+            ):
+                raise ContentChangedError()
+            with self.connection.blobopen(
+                "content", "data", self.contentid, readonly=True
+            ) as blob:
+                blob.seek(offset)
+                return blob.read(length)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+
+def open_content_blob(
+    project: str, contentid: int, preload_size: int = 0
+) -> Optional[ContentBlob]:
+    """
+    Opens a contents data for incremental reads without loading it into memory.
+    Blocking, call from a worker thread.
+    :param preload_size: Data up to this size is read at once and the connection closed right away.
+    """
+    connection = sqlite3.connect(
+        f"file:{database.url.database}?mode=ro",
+        uri=True,
+        check_same_thread=False,
+        timeout=5,
+        isolation_level=None,
+    )
+    try:
+        # The version and the data are read within the same transaction, so they match
+        data = None
+        with read_transaction(connection):
+            version = get_version(connection, project, contentid)
+            if version is not None:
+                with connection.blobopen(
+                    "content", "data", contentid, readonly=True
+                ) as blob:
+                    size = len(blob)
+                    if size <= preload_size:
+                        data = blob.read()
+                    header = blob.read(8) if data is None else data[:8]
+
+        if version is None or data is not None:
+            connection.close()
+        if version is None:
+            return None
+        return ContentBlob(
+            None if data is not None else connection,
+            project,
+            contentid,
+            version,
+            size,
+            header,
+            data,
+        )
+    except BaseException:
+        connection.close()
+        raise
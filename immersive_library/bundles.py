@@ -0,0 +1,253 @@
+import asyncio
+import io
+import logging
+import os
+import tarfile
+import tempfile
+import time
+import uuid
+import zipfile
+from enum import Enum
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+from fastapi_cache import FastAPICache
+
+from immersive_library import caching
+from immersive_library.blobs import get_media_type
+from immersive_library.changes import get_latest_change
+from immersive_library.common import BundleFilter, database, projects
+from immersive_library.utils import ALL_JOINS, LIST_FIELDS, get_content_dict, get_select
+
+logger = logging.getLogger(__name__)
+
+# Where finished bundles are kept, shared by all workers
+BUNDLE_DIR = os.getenv("BUNDLE_DIR", "data/bundles")
+
+# How often projects are checked for changes since their last build
+BUNDLE_INTERVAL = int(os.getenv("BUNDLE_INTERVAL", "600"))
+
+# Blobs fetched per query while building
+BUNDLE_BATCH_SIZE = int(os.getenv("BUNDLE_BATCH_SIZE", "100"))
+
+# Upper bound for a single build, after which another worker may take over
+BUNDLE_TIMEOUT = 3600
+
+INDEX_NAME = "index.json"
+
+EXTENSIONS = {
+    "image/png": "png",
+    "image/jpeg": "jpg",
+    "image/gif": "gif",
+    "application/gzip": "gz",
+}
+
+
+class BundleFormat(str, Enum):
+    ZIP = "zip"
+    TAR = "tar"
+
+    @property
+    def media_type(self) -> str:
+        return "application/zip" if self == BundleFormat.ZIP else "application/x-tar"
+
+
+def get_bundle_path(project: str, name: str, bundle_format: BundleFormat) -> str:
+    return os.path.join(BUNDLE_DIR, f"{project}-{name}.{bundle_format.value}")
+
+
+def read_index(path: str) -> Optional[Dict[str, Any]]:
+    """
+    Reads the index of a previously built zip bundle, None if there is none
+    """
+    try:
+        with zipfile.ZipFile(path) as archive:
+            return orjson.loads(archive.read(INDEX_NAME))
+    except (OSError, KeyError, zipfile.BadZipFile, orjson.JSONDecodeError):
+        return None
+
+
+class BundleWriter:
+    def __init__(self, project: str, name: str, previous: Optional[Dict[str, Any]]):
+        """
+        Writes a zip and a tar bundle side by side, swapped in once complete.
+        Blocking, call from a worker thread.
+        :param previous: The index of the previous build, unchanged blobs are copied from it.
+        """
+        self.paths = [get_bundle_path(project, name, f) for f in BundleFormat]
+        self.previous_files = {
+            (c["contentid"], c["version"]): c["file"]
+            for c in (previous or {}).get("contents", [])
+        }
+        self.previous = zipfile.ZipFile(self.paths[0]) if self.previous_files else None
+
+        # Unique per build, a concurrent build never writes into the same file
+        self.temporary_paths = []
+        for path in self.paths:
+            fd, temporary_path = tempfile.mkstemp(
+                dir=BUNDLE_DIR, prefix=os.path.basename(path) + ".", suffix=".tmp"
+            )
+            os.close(fd)
+            os.chmod(temporary_path, 0o644)
+            self.temporary_paths.append(temporary_path)
+        self.zip = zipfile.ZipFile(self.temporary_paths[0], "w")
+        self.tar = tarfile.open(self.temporary_paths[1], "w")
+        self.mtime = time.time()
+
+    def reusable(self, contentid: int, version: int) -> bool:
+        return (contentid, version) in self.previous_files
+
+    def add(self, name: str, data: bytes, compress: bool = False):
+        self.zip.writestr(
+            name,
+            data,
+            compress_type=zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED,
+        )
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(self.mtime)
+        self.tar.addfile(info, io.BytesIO(data))
+
+    def add_blobs(self, blobs: List[Tuple[Dict[str, Any], Optional[bytes]]]):
+        """
+        Adds a batch of blobs, filling in the file name of each content
+        :param blobs: Contents and their data, or None to copy from the previous build.
+        """
+        for content, data in blobs:
+            key = (content["contentid"], content["version"])
+            if data is None:
+                content["file"] = self.previous_files[key]
+                data = self.previous.read(content["file"])
+            else:
+                extension = EXTENSIONS.get(get_media_type(data[:8]), "bin")
+                content["file"] = f"{content['contentid']}.{extension}"
+            self.add(content["file"], data)
+
+    def commit(self, index: Dict[str, Any]):
+        self.add(INDEX_NAME, orjson.dumps(index), compress=True)
+        self.close()
+        for temporary_path, path in zip(self.temporary_paths, self.paths):
+            os.replace(temporary_path, path)
+
+    def close(self):
+        self.zip.close()
+        self.tar.close()
+        if self.previous is not None:
+            self.previous.close()
+
+    def abort(self):
+        self.close()
+        for temporary_path in self.temporary_paths:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+
+async def build_bundle(project: str, name: str, bundle_filter: BundleFilter) -> bool:
+    """
+    Rebuilds a bundle if its project changed since the last build
+    :return: Whether the bundle has been rebuilt.
+    """
+    seq = await get_latest_change(project)
+    previous = await asyncio.to_thread(
+        read_index, get_bundle_path(project, name, BundleFormat.ZIP)
+    )
+    definition = bundle_filter._asdict()
+    if (
+        previous is not None
+        and previous["seq"] == seq
+        and previous["filter"] == definition
+    ):
+        return False
+
+    prompt = "WHERE c.project = :project AND NOT users.banned AND COALESCE(precomputation.likes, 0) >= :min_likes"
+    values: Dict[str, Any] = {"project": project, "min_likes": bundle_filter.min_likes}
+    if bundle_filter.tag is not None:
+        prompt += " AND EXISTS (SELECT 1 FROM tags WHERE tags.contentid = c.oid AND tags.tag = :tag)"
+        values["tag"] = bundle_filter.tag
+    rows = await database.fetch_all(
+        get_select(LIST_FIELDS, ALL_JOINS) + prompt + " ORDER BY c.oid", values
+    )
+    contents = [get_content_dict(row, LIST_FIELDS, parse_meta=True) for row in rows]
+
+    os.makedirs(BUNDLE_DIR, exist_ok=True)
+    writer = await asyncio.to_thread(BundleWriter, project, name, previous)
+    try:
+        for start in range(0, len(contents), BUNDLE_BATCH_SIZE):
+            batch = contents[start : start + BUNDLE_BATCH_SIZE]
+
+            # Only blobs which changed since the last build are read from the database
+            missing = [
+                c["contentid"]
+                for c in batch
+                if not writer.reusable(c["contentid"], c["version"])
+            ]
+            data = {}
+            if missing:
+                data = {
+                    row[0]: row[1]
+                    for row in await database.fetch_all(
+                        """
+                        SELECT oid, data FROM content
+                        WHERE oid IN (SELECT value FROM json_each(:contentids)) AND data IS NOT NULL
+                        """,
+                        {"contentids": orjson.dumps(missing).decode()},
+                    )
+                }
+
+            # Content deleted in the meantime is left out
+            blobs = []
+            for content in batch:
+                if writer.reusable(content["contentid"], content["version"]):
+                    blobs.append((content, None))
+                elif content["contentid"] in data:
+                    blobs.append((content, data[content["contentid"]]))
+            await asyncio.to_thread(writer.add_blobs, blobs)
+
+        index = {
+            "project": project,
+            "bundle": name,
+            "filter": definition,
+            "seq": seq,
+            "created": time.time(),
+            "contents": [c for c in contents if "file" in c],
+        }
+        await asyncio.to_thread(writer.commit, index)
+    except BaseException:
+        await asyncio.to_thread(writer.abort)
+        raise
+    return True
+
+
+async def build_bundles():
+    """
+    Rebuilds every outdated bundle, each by a single worker at a time
+    """
+    backend = FastAPICache.get_backend()
+    for project, settings in projects.items():
+        for name, bundle_filter in settings.bundles.items():
+            key = f"{FastAPICache.get_prefix()}:bundles:{project}:{name}"
+            token = uuid.uuid4().hex
+            if not await caching.acquire_lock(backend, key, token, BUNDLE_TIMEOUT):
+                continue
+            try:
+                # The Redis lock lets everyone through while Redis is down, the file lock does not
+                os.makedirs(BUNDLE_DIR, exist_ok=True)
+                lock_path = os.path.join(BUNDLE_DIR, f"{project}-{name}.lock")
+                with caching.file_lock(lock_path) as locked:
+                    if locked and await build_bundle(project, name, bundle_filter):
+                        logger.info(f"Rebuilt bundle '{name}' of '{project}'")
+            except Exception:
+                logger.warning(
+                    f"Error building bundle '{name}' of '{project}':", exc_info=True
+                )
+            finally:
+                await caching.release_lock(backend, key, token)
+
+
+async def run():
+    """
+    Keeps the bundles in sync with their projects
+    """
+    while True:
+        await build_bundles()
+        await asyncio.sleep(BUNDLE_INTERVAL)
@@ -0,0 +1,671 @@
+import asyncio
+import fcntl
+import hashlib
+import logging
+import os
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from enum import Enum
+from functools import cache as memoize
+from functools import wraps
+from inspect import Parameter, isawaitable, signature
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Iterator,
+    Optional,
+    Type,
+    get_type_hints,
+)
+
+import orjson
+from cachetools import TLRUCache
+from fastapi import params
+from fastapi.dependencies.utils import (
+    get_typed_return_annotation,
+    get_typed_signature,
+)
+from fastapi_cache import Coder, FastAPICache
+from fastapi_cache.backends.redis import RedisBackend
+from fastapi_cache.decorator import _augment_signature, _locate_param, _uncacheable
+from fastapi_cache.types import Backend, KeyBuilder
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.status import HTTP_304_NOT_MODIFIED
+
+from immersive_library.metrics import CACHE_DEGRADED, CACHE_ERRORS
+from immersive_library.utils import etag_matches
+
+logger = logging.getLogger(__name__)
+
+# Seconds an expired entry is still served while a single request refreshes it
+STALE_GRACE = int(os.getenv("CACHE_STALE_GRACE", "30"))
+
+# Upper bound for how long a recompute may hold the cross-worker lock
+LOCK_TIMEOUT = float(os.getenv("CACHE_LOCK_TIMEOUT", "10"))
+LOCK_POLL_INTERVAL = 0.05
+
+# Consecutive Redis failures after which the in-process cache takes over
+FAILURE_THRESHOLD = int(os.getenv("CACHE_FAILURE_THRESHOLD", "3"))
+
+# How often Redis is probed while degraded
+RECONNECT_INTERVAL = float(os.getenv("CACHE_RECONNECT_INTERVAL", "5"))
+
+# Entries kept by the in-process cache while degraded
+LOCAL_CACHE_SIZE = int(os.getenv("CACHE_LOCAL_SIZE", "1024"))
+
+# Recomputations currently running in this worker, by cache key
+_inflight: dict[str, asyncio.Future[bytes]] = {}
+
+# Keeps a reference to fire-and-forget revalidations
+_background_tasks: set[asyncio.Task] = set()
+
+# Endpoints which may be precomputed by the warm-up job, by name
+endpoints: dict[str, Callable[..., Awaitable[Any]]] = {}
+
+# Requests to warm-up endpoints since the last flush, by (endpoint, parameters)
+traffic: Counter[tuple[str, bytes]] = Counter()
+
+# Parameters which make a response personal, those are never warmed up
+PERSONAL_PARAMETERS = ("token", "authorization", "userid")
+
+
+class RawJsonCoder(Coder):
+    """
+    For endpoints which already return encoded JSON, stored and returned as-is.
+    """
+
+    @classmethod
+    def encode(cls, value: bytes) -> bytes:
+        return value
+
+    @classmethod
+    def decode(cls, value: bytes) -> bytes:
+        return value
+
+
+class CacheBackend(RedisBackend):
+    """
+    Redis backend with a short-lived lock to elect a single recompute across workers.
+    """
+
+    _release_script = """
+        if redis.call('get', KEYS[1]) == ARGV[1] then
+            return redis.call('del', KEYS[1])
+        end
+        return 0
+    """
+
+    async def acquire_lock(self, key: str, token: str, timeout: float) -> bool:
+        return bool(
+            await self.redis.set(f"{key}:lock", token, nx=True, px=int(timeout * 1000))
+        )
+
+    async def release_lock(self, key: str, token: str):
+        await self.redis.eval(self._release_script, 1, f"{key}:lock", token)
+
+    async def record_traffic(self, key: str, counts: Counter, decay: float, keep: int):
+        """
+        Decays the previous request counts and adds the new ones, keeping the top entries
+        """
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zunionstore(key, {key: decay})
+            for member, count in counts.items():
+                pipe.zincrby(key, count, member)
+            pipe.zremrangebyrank(key, 0, -keep - 1)
+            await pipe.execute()
+
+    async def top_traffic(self, key: str, count: int) -> list[bytes]:
+        return await self.redis.zrevrange(key, 0, count - 1)
+
+    async def get_many(self, keys: list[str]) -> list[Optional[bytes]]:
+        return await self.redis.mget(keys)
+
+    async def publish(self, channel: str, message: bytes) -> bool:
+        await self.redis.publish(channel, message)
+        return True
+
+    def pubsub(self):
+        return self.redis.pubsub()
+
+
+class ResilientBackend(Backend):
+    """
+    Circuit breaker around Redis, failing over to a bounded in-process cache while Redis is down or slow.
+    """
+
+    def __init__(self, backend: CacheBackend, maxsize: int = LOCAL_CACHE_SIZE):
+        self.backend = backend
+        self.local: TLRUCache[str, tuple[float, bytes]] = TLRUCache(
+            maxsize=maxsize, ttu=lambda _key, value, _now: value[0]
+        )
+        self.failures = 0
+        self.degraded = False
+
+    def _failed(self, operation: str):
+        CACHE_ERRORS.labels(operation).inc()
+        self.failures += 1
+        if not self.degraded and self.failures >= FAILURE_THRESHOLD:
+            logger.warning("Redis is failing, switching to the in-process cache")
+            self.degraded = True
+            CACHE_DEGRADED.set(1)
+
+    async def _call(self, operation: str, *args, fallback: Callable[[], Any]):
+        if self.degraded:
+            return fallback()
+        try:
+            result = await getattr(self.backend, operation)(*args)
+        except Exception:
+            logger.debug(f"Redis {operation} failed:", exc_info=True)
+            self._failed(operation)
+            return fallback()
+        self.failures = 0
+        return result
+
+    def _local_get_with_ttl(self, key: str) -> tuple[int, Optional[bytes]]:
+        value = self.local.get(key)
+        if value is None:
+            return 0, None
+        expires_at, data = value
+        if expires_at == float("inf"):
+            return -1, data
+        return int(expires_at - self.local.timer()), data
+
+    def _local_set(self, key: str, value: bytes, expire: Optional[int] = None):
+        expires_at = float("inf") if expire is None else self.local.timer() + expire
+        self.local[key] = (expires_at, value)
+
+    async def get_with_ttl(self, key: str) -> tuple[int, Optional[bytes]]:
+        return await self._call(
+            "get_with_ttl", key, fallback=lambda: self._local_get_with_ttl(key)
+        )
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._call(
+            "get", key, fallback=lambda: self._local_get_with_ttl(key)[1]
+        )
+
+    async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
+        await self._call(
+            "set",
+            key,
+            value,
+            expire,
+            fallback=lambda: self._local_set(key, value, expire),
+        )
+
+    async def clear(
+        self, namespace: Optional[str] = None, key: Optional[str] = None
+    ) -> int:
+        if namespace:
+            for k in [k for k in self.local if k.startswith(namespace)]:
+                self.local.pop(k, None)
+        elif key:
+            self.local.pop(key, None)
+        return await self._call("clear", namespace, key, fallback=lambda: 0)
+
+    async def acquire_lock(self, key: str, token: str, timeout: float) -> bool:
+        # Without Redis, the per-worker single flight is all we have
+        return await self._call(
+            "acquire_lock", key, token, timeout, fallback=lambda: True
+        )
+
+    async def release_lock(self, key: str, token: str):
+        await self._call("release_lock", key, token, fallback=lambda: None)
+
+    async def record_traffic(self, key: str, counts: Counter, decay: float, keep: int):
+        await self._call(
+            "record_traffic", key, counts, decay, keep, fallback=lambda: None
+        )
+
+    async def top_traffic(self, key: str, count: int) -> list[bytes]:
+        return await self._call("top_traffic", key, count, fallback=lambda: [])
+
+    async def get_many(self, keys: list[str]) -> list[Optional[bytes]]:
+        return await self._call(
+            "get_many",
+            keys,
+            fallback=lambda: [self._local_get_with_ttl(key)[1] for key in keys],
+        )
+
+    async def publish(self, channel: str, message: bytes) -> bool:
+        # Without Redis, only this worker's subscribers are reached
+        return await self._call("publish", channel, message, fallback=lambda: False)
+
+    def pubsub(self):
+        return self.backend.pubsub()
+
+    async def run(self):
+        """
+        Probes Redis in the background while degraded and switches back once it answers
+        """
+        while True:
+            await asyncio.sleep(RECONNECT_INTERVAL)
+            if not self.degraded:
+                continue
+            try:
+                await self.backend.redis.ping()
+            except Exception:
+                continue
+            logger.warning("Redis is back, leaving the in-process cache")
+            self.failures = 0
+            self.degraded = False
+            self.local.clear()
+            CACHE_DEGRADED.set(0)
+
+
+@memoize
+def _parameters(func: Callable) -> list[tuple[str, Any, Optional[type[Enum]]]]:
+    """
+    Return name, resolved default and enum type of each parameter
+    """
+    hints = get_type_hints(func)
+    parameters = []
+    for name, parameter in signature(func).parameters.items():
+        default = parameter.default
+        if isinstance(default, params.Depends):
+            default = Parameter.empty
+        elif isinstance(default, params.Param):
+            default = default.default
+        hint = hints.get(name)
+        enum = hint if isinstance(hint, type) and issubclass(hint, Enum) else None
+        parameters.append((name, default, enum))
+    return parameters
+
+
+def bind_parameters(
+    func: Callable, args: tuple, kwargs: dict[str, Any]
+) -> dict[str, Any]:
+    """
+    Maps positional, keyword and default arguments onto parameter names in declaration order.
+    Calls from FastAPI, direct calls and warm-up replays therefore produce the same mapping.
+    """
+    bound = {}
+    for index, (name, default, enum) in enumerate(_parameters(func)):
+        if index < len(args):
+            value = args[index]
+        elif name in kwargs:
+            value = kwargs[name]
+        elif default is not Parameter.empty:
+            value = default
+        else:
+            continue
+        if enum is not None and value is not None:
+            value = enum(value)
+        bound[name] = value
+    return bound
+
+
+def canonical_key_builder(
+    func: Callable,
+    namespace: str = "",
+    *,
+    request: Optional[Request] = None,
+    response: Optional[Response] = None,
+    args: tuple,
+    kwargs: dict[str, Any],
+) -> str:
+    """
+    Builds keys from the bound parameters instead of how the function has been called.
+    """
+    parameters = orjson.dumps(bind_parameters(func, args, kwargs), default=str)
+    cache_key = hashlib.md5(
+        f"{func.__module__}:{func.__name__}:".encode() + parameters
+    ).hexdigest()
+    return f"{namespace}:{cache_key}"
+
+
+def record_request(func: Callable, args: tuple, kwargs: dict[str, Any]):
+    """
+    Counts a public request to a warm-up endpoint
+    """
+    parameters = bind_parameters(func, args, kwargs)
+    if any(parameters.get(name) is not None for name in PERSONAL_PARAMETERS):
+        return
+    traffic[(func.__name__, orjson.dumps(parameters, default=str))] += 1
+
+
+async def call_endpoint(name: str, parameters: dict[str, Any]) -> Any:
+    """
+    Calls a warm-up endpoint by name, going through its cache
+    """
+    endpoint = endpoints[name]
+    return await endpoint(**bind_parameters(endpoint.__wrapped__, (), parameters))
+
+
+def get_key(endpoint: Callable[..., Awaitable[Any]], **parameters: Any) -> str:
+    """
+    The key a cached function stores its result under for the given parameters
+    """
+    return canonical_key_builder(
+        endpoint.__wrapped__,
+        f"{FastAPICache.get_prefix()}:",
+        args=(),
+        kwargs=parameters,
+    )
+
+
+async def get_many(keys: list[str]) -> list[Optional[bytes]]:
+    """
+    Looks up several keys in one round trip, None for misses
+    """
+    backend = FastAPICache.get_backend()
+    try:
+        if hasattr(backend, "get_many"):
+            return await backend.get_many(keys)
+        return [await backend.get(key) for key in keys]
+    except Exception:
+        logger.warning("Error retrieving cache keys:", exc_info=True)
+        return [None] * len(keys)
+
+
+async def set_many(items: dict[str, bytes], expire: int):
+    """
+    Stores several encoded results, as the cache decorator would
+    """
+    backend = FastAPICache.get_backend()
+    await asyncio.gather(
+        *[_store(backend, key, value, expire) for key, value in items.items()]
+    )
+
+
+async def invalidate(endpoint: Callable[..., Awaitable[Any]], **parameters: Any):
+    """
+    Drops the cached result of a cached function for the given parameters, e.g. after its data changed
+    """
+    key = get_key(endpoint, **parameters)
+    try:
+        await FastAPICache.get_backend().clear(key=key)
+    except Exception:
+        logger.warning(f"Error invalidating cache key '{key}':", exc_info=True)
+
+
+async def acquire_lock(
+    backend: Backend, key: str, token: str, timeout: float = LOCK_TIMEOUT
+) -> bool:
+    """
+    Tries to take a cross-worker lock, backends without locking always succeed
+    """
+    if not hasattr(backend, "acquire_lock"):
+        return True
+    try:
+        return await backend.acquire_lock(key, token, timeout)
+    except Exception:
+        logger.warning(f"Error acquiring lock for '{key}':", exc_info=True)
+        return True
+
+
+async def release_lock(backend: Backend, key: str, token: str):
+    if not hasattr(backend, "release_lock"):
+        return
+    try:
+        await backend.release_lock(key, token)
+    except Exception:
+        logger.warning(f"Error releasing lock for '{key}':", exc_info=True)
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[bool]:
+    """
+    Tries to take an exclusive lock on a file, shared by all workers on this host and held even while Redis is down
+    :return: Whether the lock has been taken.
+    """
+    with open(path, "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+async def publish(backend: Backend, channel: str, message: bytes) -> bool:
+    """
+    Publishes to all workers, False if the backend could not deliver it
+    """
+    if not hasattr(backend, "publish"):
+        return False
+    try:
+        return await backend.publish(channel, message)
+    except Exception:
+        logger.warning(f"Error publishing to '{channel}':", exc_info=True)
+        return False
+
+
+async def _get_with_ttl(backend: Backend, key: str) -> tuple[int, Optional[bytes]]:
+    try:
+        return await backend.get_with_ttl(key)
+    except Exception:
+        logger.warning(f"Error retrieving cache key '{key}':", exc_info=True)
+        return 0, None
+
+
+async def _store(backend: Backend, key: str, value: bytes, expire: int):
+    try:
+        await backend.set(key, value, expire + STALE_GRACE)
+    except Exception:
+        logger.warning(f"Error setting cache key '{key}':", exc_info=True)
+
+
+async def _fill(
+    backend: Backend,
+    key: str,
+    produce: Callable[[], Awaitable[bytes]],
+    expire: int,
+    wait: bool = True,
+) -> Optional[bytes]:
+    """
+    Recomputes a key, or waits for the worker currently recomputing it.
+    :param wait: Whether to wait for another worker, otherwise None is returned if it holds the lock
+    """
+    token = uuid.uuid4().hex
+    if await acquire_lock(backend, key, token):
+        try:
+            value = await produce()
+            await _store(backend, key, value, expire)
+            return value
+        finally:
+            await release_lock(backend, key, token)
+
+    if not wait:
+        return None
+
+    # Another worker is recomputing, wait for its result
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + LOCK_TIMEOUT
+    while loop.time() < deadline:
+        await asyncio.sleep(LOCK_POLL_INTERVAL)
+        ttl, value = await _get_with_ttl(backend, key)
+        if value is not None and ttl > STALE_GRACE:
+            return value
+
+    # The other worker took too long, compute it ourselves
+    value = await produce()
+    await _store(backend, key, value, expire)
+    return value
+
+
+async def _single_flight(
+    backend: Backend,
+    key: str,
+    produce: Callable[[], Awaitable[bytes]],
+    expire: int,
+    wait: bool = True,
+) -> Optional[bytes]:
+    """
+    Coalesces concurrent recomputations of the same key within this worker.
+    """
+    future = _inflight.get(key)
+    if future is not None:
+        if not wait:
+            return None
+        await asyncio.wait([future])
+        if not future.cancelled():
+            return future.result()
+
+        # The leader failed, recompute on our own
+        return await produce()
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        value = await _fill(backend, key, produce, expire, wait)
+    except BaseException:
+        future.cancel()
+        raise
+    else:
+        if value is None:
+            future.cancel()
+        else:
+            future.set_result(value)
+        return value
+    finally:
+        _inflight.pop(key, None)
+
+
+def _revalidate(
+    backend: Backend,
+    key: str,
+    produce: Callable[[], Awaitable[bytes]],
+    expire: int,
+):
+    """
+    Refreshes a stale key in the background unless someone already does.
+    """
+    if key in _inflight:
+        return
+
+    async def run():
+        try:
+            await _single_flight(backend, key, produce, expire, wait=False)
+        except Exception:
+            logger.warning(f"Error revalidating cache key '{key}':", exc_info=True)
+
+    task = asyncio.create_task(run())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+def cache(
+    expire: Optional[int] = None,
+    coder: Optional[Type[Coder]] = None,
+    key_builder: Optional[KeyBuilder] = None,
+    namespace: str = "",
+    injected_dependency_namespace: str = "__fastapi_cache",
+    warm_up: bool = False,
+):
+    """
+    Drop-in replacement for fastapi_cache's decorator which coalesces concurrent misses.
+    Only one request per key recomputes, across workers via a Redis lock, while the others wait for it.
+    Expired entries are kept for STALE_GRACE seconds and served while being refreshed in the background.
+    :param warm_up: Learn popular requests to this endpoint and precompute them in the warm-up job.
+    """
+
+    injected_request = Parameter(
+        name=f"{injected_dependency_namespace}_request",
+        annotation=Request,
+        kind=Parameter.KEYWORD_ONLY,
+    )
+    injected_response = Parameter(
+        name=f"{injected_dependency_namespace}_response",
+        annotation=Response,
+        kind=Parameter.KEYWORD_ONLY,
+    )
+
+    def wrapper(func: Callable[..., Awaitable[Any]]):
+        wrapped_signature = get_typed_signature(func)
+        to_inject: list[Parameter] = []
+        request_param = _locate_param(wrapped_signature, injected_request, to_inject)
+        response_param = _locate_param(wrapped_signature, injected_response, to_inject)
+        return_type = get_typed_return_annotation(func)
+
+        @wraps(func)
+        async def inner(*args, **kwargs):
+            def call():
+                kwargs.pop(injected_request.name, None)
+                kwargs.pop(injected_response.name, None)
+                return func(*args, **kwargs)
+
+            copy_kwargs = kwargs.copy()
+            request: Optional[Request] = copy_kwargs.pop(request_param.name, None)
+            response: Optional[Response] = copy_kwargs.pop(response_param.name, None)
+
+            if _uncacheable(request):
+                return await call()
+
+            if warm_up and request is not None:
+                record_request(func, args, copy_kwargs)
+
+            prefix = FastAPICache.get_prefix()
+            used_coder = coder or FastAPICache.get_coder()
+            used_expire = expire or FastAPICache.get_expire() or 60
+            used_key_builder = key_builder or FastAPICache.get_key_builder()
+            backend = FastAPICache.get_backend()
+            cache_status_header = FastAPICache.get_cache_status_header()
+
+            cache_key = used_key_builder(
+                func,
+                f"{prefix}:{namespace}",
+                request=request,
+                response=response,
+                args=args,
+                kwargs=copy_kwargs,
+            )
+            if isawaitable(cache_key):
+                cache_key = await cache_key
+
+            async def produce() -> bytes:
+                return used_coder.encode(await call())
+
+            ttl, cached = await _get_with_ttl(backend, cache_key)
+
+            if cached is None or (
+                request is not None
+                and request.headers.get("Cache-Control") == "no-cache"
+            ):
+                # Cache miss, let a single request recompute
+                if cached is None:
+                    cached = await _single_flight(
+                        backend, cache_key, produce, used_expire
+                    )
+                else:
+                    cached = await produce()
+                    await _store(backend, cache_key, cached, used_expire)
+                status, max_age = "MISS", used_expire
+            elif 0 <= ttl <= STALE_GRACE:
+                # Expired, serve stale while a single request refreshes it
+                _revalidate(backend, cache_key, produce, used_expire)
+                status, max_age = "STALE", 0
+            else:
+                status, max_age = "HIT", ttl - STALE_GRACE if ttl > 0 else used_expire
+
+            if response:
+                etag = f"W/{hash(cached)}"
+                response.headers.update(
+                    {
+                        "Cache-Control": f"max-age={max_age}",
+                        "ETag": etag,
+                        cache_status_header: status,
+                    }
+                )
+
+                if_none_match = request and request.headers.get("if-none-match")
+                if status != "MISS" and etag_matches(if_none_match, etag):
+                    response.status_code = HTTP_304_NOT_MODIFIED
+                    return response
+
+            return used_coder.decode_as_type(cached, type_=return_type)
+
+        inner.__signature__ = _augment_signature(wrapped_signature, *to_inject)
+
+        if warm_up:
+            endpoints[func.__name__] = inner
+
+        return inner
+
+    return wrapper
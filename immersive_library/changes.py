@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Optional
+
+from databases import Database
+from fastapi_cache import FastAPICache
+
+from immersive_library import caching, events
+from immersive_library.common import database
+
+logger = logging.getLogger(__name__)
+
+# Seconds tombstones are kept, clients with an older cursor have to resync
+CHANGES_RETENTION = int(os.getenv("CHANGES_RETENTION", str(90 * 86400)))
+
+# How often superseded entries are compacted and old tombstones pruned
+CHANGES_COMPACT_INTERVAL = int(os.getenv("CHANGES_COMPACT_INTERVAL", "3600"))
+
+
+async def setup_changes():
+    await database.execute("""
+        CREATE TABLE IF NOT EXISTS changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            project CHAR,
+            contentid INTEGER,
+            deleted INTEGER,
+            created REAL
+        )
+    """)
+    await database.execute(
+        "CREATE INDEX IF NOT EXISTS changes_project_seq on changes (project, seq)"
+    )
+    await database.execute(
+        "CREATE INDEX IF NOT EXISTS changes_contentid on changes (contentid, seq)"
+    )
+
+    # Start the log with everything which already exists, so a full sync is complete
+    if await database.fetch_val("SELECT count(*) FROM changes") == 0:
+        await database.execute(
+            """
+            INSERT INTO changes (project, contentid, deleted, created)
+            SELECT project, oid, 0, :created FROM content ORDER BY oid
+            """,
+            {"created": time.time()},
+        )
+
+    # The newest pruned seq per project, older cursors may have missed a tombstone
+    await database.execute("""
+        CREATE TABLE IF NOT EXISTS changes_horizon (
+            project CHAR PRIMARY KEY,
+            seq INTEGER
+        )
+    """)
+
+
+async def record_change(database: Database, contentid: int, deleted: bool = False):
+    """
+    Appends a change of a content to the log and announces it, record deletions in the transaction deleting the content
+    :param deleted: Whether the content is about to be deleted.
+    """
+    content = await database.fetch_one(
+        """
+        SELECT c.project, c.version, COALESCE(precomputation.likes, 0) AS likes
+        FROM content c
+            LEFT JOIN precomputation ON precomputation.contentid = c.oid
+        WHERE c.oid = :contentid
+        """,
+        {"contentid": contentid},
+    )
+    if content is None:
+        return
+
+    seq = await database.execute(
+        """
+        INSERT INTO changes (project, contentid, deleted, created)
+        VALUES (:project, :contentid, :deleted, :created)
+        """,
+        {
+            "project": content["project"],
+            "contentid": contentid,
+            "deleted": int(deleted),
+            "created": time.time(),
+        },
+    )
+
+    await events.publish(
+        content["project"],
+        seq,
+        {
+            "contentid": contentid,
+            "deleted": deleted,
+            "version": None if deleted else content["version"],
+            "likes": content["likes"],
+        },
+    )
+
+
+async def get_latest_change(project: str) -> Optional[int]:
+    """
+    The seq of the latest change in a project, changes whenever its content does
+    """
+    return await database.fetch_val(
+        "SELECT max(seq) FROM changes WHERE project = :project", {"project": project}
+    )
+
+
+async def get_horizon(project: str) -> int:
+    return (
+        await database.fetch_val(
+            "SELECT seq FROM changes_horizon WHERE project = :project",
+            {"project": project},
+        )
+        or 0
+    )
+
+
+async def compact():
+    """
+    Keeps only the latest entry per content and prunes tombstones past the retention
+    """
+    cutoff = time.time() - CHANGES_RETENTION
+    async with database.transaction():
+        await database.execute("""
+            DELETE FROM changes
+            WHERE seq NOT IN (SELECT max(seq) FROM changes GROUP BY contentid)
+        """)
+        await database.execute(
+            """
+            INSERT INTO changes_horizon (project, seq)
+            SELECT project, max(seq) FROM changes
+            WHERE deleted AND created < :cutoff
+            GROUP BY project
+            ON CONFLICT (project) DO UPDATE SET seq = max(seq, excluded.seq)
+            """,
+            {"cutoff": cutoff},
+        )
+        await database.execute(
+            "DELETE FROM changes WHERE deleted AND created < :cutoff",
+            {"cutoff": cutoff},
+        )
+
+
+async def run():
+    """
+    Periodically compacts the change log, once per interval across all workers
+    """
+    while True:
+        await asyncio.sleep(CHANGES_COMPACT_INTERVAL)
+        try:
+            # The lock is left to expire, so other workers skip this interval
+            if await caching.acquire_lock(
+                FastAPICache.get_backend(),
+                f"{FastAPICache.get_prefix()}:changes:compact",
+                uuid.uuid4().hex,
+                CHANGES_COMPACT_INTERVAL * 0.9,
+            ):
+                await compact()
+        except Exception:
+            logger.warning("Error compacting change log:", exc_info=True)
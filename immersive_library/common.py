@@ -1,6 +1,7 @@
+import asyncio
 import os
 import sqlite3
-from typing import List, Optional
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
 
 from databases import Database
 from fastapi import HTTPException
@@ -28,17 +29,62 @@ database = Database(
 templates = Jinja2Templates(directory="templates")
 
 
+class BundleFilter(NamedTuple):
+    min_likes: int = 0
+    tag: Optional[str] = None
+
+
 class Project:
     validators: List[Validator]
 
+    # Cached endpoints and their parameters to precompute after startup or a cache flush
+    warm_up_requests: List[Tuple[str, Dict[str, Any]]]
+
+    # Downloadable archives of the project's content, by name
+    bundles: Dict[str, BundleFilter]
+
+    # Parameters of the deprecated content list to keep pre-rendered on disk
+    snapshots: List[Dict[str, Any]]
+
     def __init__(self):
         self.validators = []
+        self.warm_up_requests = []
+        self.bundles = {}
+        self.snapshots = [{}]
+
+    @property
+    def max_upload_size(self) -> Optional[int]:
+        """
+        The largest payload accepted by all validators, None if unlimited
+        """
+        sizes = [
+            v.max_upload_size for v in self.validators if v.max_upload_size is not None
+        ]
+        return min(sizes) if sizes else None
+
+    def get_stages(self) -> List[List[Validator]]:
+        """
+        Splits the validators into stages which may run concurrently, exclusive validators get their own
+        """
+        stages = []
+        for validator in self.validators:
+            if validator.exclusive or not stages or stages[-1][0].exclusive:
+                stages.append([validator])
+            else:
+                stages[-1].append(validator)
+        return stages
 
     async def validate(self, callback: str, *args):
-        for validator in self.validators:
-            exception = await validator.__getattribute__(callback)(*args)
-            if exception is not None:
-                raise HTTPException(400, exception)
+        """
+        Runs a check of every validator, raising the first objection in declaration order
+        """
+        for stage in self.get_stages():
+            exceptions = await asyncio.gather(
+                *[validator.__getattribute__(callback)(*args) for validator in stage]
+            )
+            for exception in exceptions:
+                if exception is not None:
+                    raise HTTPException(400, exception)
 
     async def call(self, callback: str, *args, **kwargs) -> List[Optional[str]]:
         log = []
@@ -0,0 +1,138 @@
+from enum import Enum
+from typing import Any, List, Optional
+
+import cbor2
+import orjson
+import ormsgpack
+from starlette.responses import Response
+
+
+class ResponseFormat(str, Enum):
+    JSON = "application/json"
+    MSGPACK = "application/msgpack"
+    CBOR = "application/cbor"
+
+    @property
+    def binary(self) -> bool:
+        """
+        Binary formats carry data as bytes instead of base64 and meta as a native map
+        """
+        return self != ResponseFormat.JSON
+
+
+# Accepted media types, including common aliases
+MEDIA_TYPES = {
+    "application/json": ResponseFormat.JSON,
+    "application/msgpack": ResponseFormat.MSGPACK,
+    "application/x-msgpack": ResponseFormat.MSGPACK,
+    "application/vnd.msgpack": ResponseFormat.MSGPACK,
+    "application/cbor": ResponseFormat.CBOR,
+}
+
+# Documents the alternative formats in the OpenAPI schema
+ALTERNATIVE_RESPONSES = {
+    200: {
+        "content": {
+            ResponseFormat.MSGPACK.value: {},
+            ResponseFormat.CBOR.value: {},
+        }
+    }
+}
+
+
+def negotiate_format(accept: Optional[str]) -> ResponseFormat:
+    """
+    Picks the preferred supported format from an Accept header, JSON unless a binary format is preferred
+    """
+    best, best_quality = ResponseFormat.JSON, 0.0
+    for media_range in (accept or "").split(","):
+        media_type, *parameters = media_range.split(";")
+        response_format = MEDIA_TYPES.get(media_type.strip().lower())
+        if response_format is None:
+            continue
+
+        quality = 1.0
+        for parameter in parameters:
+            key, _, value = parameter.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+
+        if quality > best_quality:
+            best, best_quality = response_format, quality
+    return best
+
+
+def encode_document(document: Any, response_format: ResponseFormat) -> bytes:
+    if response_format == ResponseFormat.MSGPACK:
+        return ormsgpack.packb(document)
+    if response_format == ResponseFormat.CBOR:
+        return cbor2.dumps(document)
+    return orjson.dumps(document)
+
+
+def decode_document(content: bytes, response_format: ResponseFormat) -> Any:
+    if response_format == ResponseFormat.MSGPACK:
+        return ormsgpack.unpackb(content)
+    if response_format == ResponseFormat.CBOR:
+        return cbor2.loads(content)
+    return orjson.loads(content)
+
+
+def get_document_prefix(key: str, response_format: ResponseFormat) -> bytes:
+    """
+    How an encoded single key map {key: value} starts, right before the value
+    """
+    if response_format == ResponseFormat.MSGPACK:
+        return b"\x81" + ormsgpack.packb(key)
+    if response_format == ResponseFormat.CBOR:
+        return b"\xa1" + cbor2.dumps(key)
+    return b'{"' + key.encode() + b'":'
+
+
+def unwrap_document(content: bytes, key: str, response_format: ResponseFormat) -> bytes:
+    """
+    The encoded value of an encoded {key: value} map, without decoding it
+    """
+    prefix = get_document_prefix(key, response_format)
+    assert content.startswith(prefix)
+    end = -1 if response_format == ResponseFormat.JSON else len(content)
+    return content[len(prefix) : end]
+
+
+def join_documents(
+    key: str, values: List[bytes], response_format: ResponseFormat
+) -> bytes:
+    """
+    Encodes {key: [values]} from already encoded values, without encoding them again
+    """
+    prefix = get_document_prefix(key, response_format)
+    if response_format == ResponseFormat.MSGPACK:
+        count = len(values)
+        if count < 16:
+            header = bytes([0x90 | count])
+        elif count < 65536:
+            header = b"\xdc" + count.to_bytes(2, "big")
+        else:
+            header = b"\xdd" + count.to_bytes(4, "big")
+        return prefix + header + b"".join(values)
+    if response_format == ResponseFormat.CBOR:
+        # Indefinite length array, terminated by a break
+        return prefix + b"\x9f" + b"".join(values) + b"\xff"
+    return prefix + b"[" + b",".join(values) + b"]}"
+
+
+def encoded_response(
+    content: bytes,
+    response: Response,
+    response_format: ResponseFormat = ResponseFormat.JSON,
+) -> Response:
+    """
+    Wraps an already encoded document, keeping the headers set on the injected response.
+    Returning a response directly skips FastAPI's validation and encoding.
+    """
+    headers = {k: v for k, v in response.headers.items() if k != "content-length"}
+    headers["Vary"] = "Accept"
+    return Response(content, media_type=response_format.value, headers=headers)
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, Optional, Set, Tuple
+
+import orjson
+from fastapi_cache import FastAPICache
+
+from immersive_library import caching, changes
+from immersive_library.common import database
+
+logger = logging.getLogger(__name__)
+
+# Events buffered per connection, a client falling further behind is disconnected
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "64"))
+
+# Open event streams per worker, further connections are turned away
+EVENTS_MAX_CONNECTIONS = int(os.getenv("EVENTS_MAX_CONNECTIONS", "10000"))
+
+# Seconds between keep-alive comments, so proxies do not close idle streams
+EVENTS_KEEPALIVE = 15
+
+# Seconds to wait before resubscribing after Redis failed
+EVENTS_RETRY_INTERVAL = 5
+
+# Ends a stream, the client reconnects with Last-Event-ID
+DISCONNECT = (0, b"")
+
+# Queues of the open event streams in this worker, by project, holding seq and encoded event
+subscribers: Dict[str, Set[asyncio.Queue[Tuple[int, bytes]]]] = defaultdict(set)
+
+
+def get_channel() -> str:
+    return f"{FastAPICache.get_prefix()}:events"
+
+
+def format_event(seq: int, event: Dict[str, Any]) -> bytes:
+    return b"id: %d\nevent: change\ndata: %s\n\n" % (seq, orjson.dumps(event))
+
+
+def dispatch(message: bytes):
+    """
+    Hands an event to every stream of its project, encoded once and shared
+    """
+    project, seq, event = orjson.loads(message)
+    item = (seq, format_event(seq, event))
+    for queue in list(subscribers.get(project, ())):
+        try:
+            queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # Drop the backlog instead of growing it, the client resyncs from its last id
+            subscribers[project].discard(queue)
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(DISCONNECT)
+
+
+async def publish(project: str, seq: int, event: Dict[str, Any]):
+    """
+    Sends an event to the streams of all workers
+    """
+    message = orjson.dumps([project, seq, event])
+    if not await caching.publish(FastAPICache.get_backend(), get_channel(), message):
+        dispatch(message)
+
+
+async def get_missed_events(project: str, since: int) -> Optional[Tuple[int, bytes]]:
+    """
+    The events after a given seq from the change log, None if they can no longer be replayed
+    """
+    if since < await changes.get_horizon(project):
+        return None
+    rows = await database.fetch_all(
+        """
+        SELECT changes.seq, changes.contentid, changes.deleted, c.version, precomputation.likes
+        FROM changes
+            LEFT JOIN content c ON c.oid = changes.contentid
+            LEFT JOIN precomputation ON precomputation.contentid = changes.contentid
+        WHERE changes.project = :project AND changes.seq > :since
+        ORDER BY changes.seq
+        LIMIT :limit
+        """,
+        {"project": project, "since": since, "limit": EVENTS_QUEUE_SIZE + 1},
+    )
+    if len(rows) > EVENTS_QUEUE_SIZE:
+        return None
+    if not rows:
+        return since, b""
+    return rows[-1][0], b"".join(
+        format_event(
+            row[0],
+            {
+                "contentid": row[1],
+                "deleted": bool(row[2]) or row[3] is None,
+                "version": row[3],
+                "likes": row[4] or 0,
+            },
+        )
+        for row in rows
+    )
+
+
+async def stream_events(
+    project: str, last_event_id: Optional[int]
+) -> AsyncIterator[bytes]:
+    """
+    Yields the events of a project as they happen, starting after the last seen event
+    """
+    queue: asyncio.Queue[Tuple[int, bytes]] = asyncio.Queue(maxsize=EVENTS_QUEUE_SIZE)
+    subscribers[project].add(queue)
+    try:
+        # Tell the client how long to wait before reconnecting
+        yield b"retry: %d\n\n" % (EVENTS_RETRY_INTERVAL * 1000)
+
+        # Subscribed first, so nothing falls between the replay and the live events
+        replayed = 0
+        if last_event_id is not None:
+            missed = await get_missed_events(project, last_event_id)
+            if missed is None:
+                yield b"event: resync\ndata: {}\n\n"
+            else:
+                replayed, data = missed
+                if data:
+                    yield data
+
+        while True:
+            try:
+                seq, data = await asyncio.wait_for(queue.get(), EVENTS_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield b": keep-alive\n\n"
+                continue
+            if (seq, data) == DISCONNECT:
+                break
+            if seq > replayed:
+                yield data
+    finally:
+        subscribers[project].discard(queue)
+        if not subscribers[project]:
+            subscribers.pop(project, None)
+
+
+def count_connections() -> int:
+    return sum(len(queues) for queues in subscribers.values())
+
+
+async def run():
+    """
+    Relays the events published by all workers to this worker's streams, over a single subscription
+    """
+    while True:
+        backend = FastAPICache.get_backend()
+        if not hasattr(backend, "pubsub"):
+            return
+        pubsub = backend.pubsub()
+        try:
+            await pubsub.subscribe(get_channel())
+            while True:
+                message = await pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=EVENTS_KEEPALIVE
+                )
+                if message is not None and message["type"] == "message":
+                    dispatch(message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.warning("Error relaying events:", exc_info=True)
+        finally:
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
+        await asyncio.sleep(EVENTS_RETRY_INTERVAL)
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import os
+import re
+import time
+from typing import Any, Mapping, Optional
+
+import requests
+from google.auth import jwt
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_CERTS_URL = os.getenv(
+    "GOOGLE_CERTS_URL", "https://www.googleapis.com/oauth2/v1/certs"
+)
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+
+# Used when the key server does not send a max-age
+DEFAULT_MAX_AGE = 3600
+
+# Refresh this many seconds before the key set expires
+REFRESH_MARGIN = 60
+
+# Wait between failed refresh attempts
+RETRY_INTERVAL = 30
+
+# Unknown key ids only force a refresh if the key set is at least this old
+MIN_REFRESH_INTERVAL = 60
+
+
+def get_max_age(headers: Mapping[str, str]) -> int:
+    """
+    Return the remaining freshness lifetime from Cache-Control and Age headers
+    """
+    match = re.search(r"max-age=(\d+)", headers.get("Cache-Control", ""))
+    max_age = int(match.group(1)) if match else DEFAULT_MAX_AGE
+    age = int(headers.get("Age", "0") or 0)
+    return max(0, max_age - age)
+
+
+class IdTokenVerifier:
+    def __init__(
+        self,
+        certs_url: str = GOOGLE_CERTS_URL,
+        audience: Optional[str] = None,
+        issuers: tuple[str, ...] = GOOGLE_ISSUERS,
+    ):
+        """
+        Verifies Google ID tokens against a cached key set without blocking the event loop.
+        :param certs_url: The endpoint serving the key id to certificate mapping.
+        :param audience: The expected audience, usually the client id.
+        :param issuers: The accepted issuers.
+        """
+        self.certs_url = certs_url
+        self.audience = audience
+        self.issuers = issuers
+
+        self.certs: Optional[dict[str, str]] = None
+        self.expires_at = 0.0
+        self.fetched_at = 0.0
+
+        self._lock = asyncio.Lock()
+
+    def _fetch(self) -> tuple[dict[str, str], int]:
+        response = requests.get(self.certs_url, timeout=10)
+        response.raise_for_status()
+        return response.json(), get_max_age(response.headers)
+
+    async def refresh(self):
+        """
+        Fetches the key set, concurrent callers share one fetch
+        """
+        expires_at = self.expires_at
+        async with self._lock:
+            if self.expires_at != expires_at:
+                return
+            certs, max_age = await asyncio.to_thread(self._fetch)
+            self.certs = certs
+            self.fetched_at = time.monotonic()
+            self.expires_at = self.fetched_at + max_age
+
+    async def get_certs(self) -> dict[str, str]:
+        if self.certs is None or time.monotonic() >= self.expires_at:
+            await self.refresh()
+        return self.certs
+
+    async def run(self):
+        """
+        Keeps the key set fresh in the background according to its cache headers
+        """
+        while True:
+            try:
+                await self.refresh()
+                delay = self.expires_at - time.monotonic() - REFRESH_MARGIN
+            except Exception:
+                logger.warning("Error refreshing ID token certificates:", exc_info=True)
+                delay = RETRY_INTERVAL
+            await asyncio.sleep(max(RETRY_INTERVAL, delay))
+
+    async def verify(self, token: str) -> dict[str, Any]:
+        """
+        Verifies signature, expiry, audience and issuer of an ID token
+        :raises ValueError: If token verification fails
+        """
+        certs = await self.get_certs()
+
+        header = jwt.decode_header(token)
+        if (
+            header.get("kid") not in certs
+            and time.monotonic() - self.fetched_at >= MIN_REFRESH_INTERVAL
+        ):
+            # Keys may have been rotated since the last refresh
+            await self.refresh()
+            certs = self.certs
+
+        info = await asyncio.to_thread(
+            jwt.decode, token, certs=certs, audience=self.audience
+        )
+
+        if info.get("iss") not in self.issuers:
+            raise ValueError(f"Wrong issuer, should be one of {self.issuers}")
+
+        return info
+
+
+id_token_verifier = IdTokenVerifier(audience=os.getenv("CLIENT_ID"))
@@ -3,7 +3,12 @@ from typing import Annotated
 from pydantic import BaseModel, StringConstraints
 
 from immersive_library.api import app
-from immersive_library.common import Project, default_project, projects
+from immersive_library.common import (
+    BundleFilter,
+    Project,
+    default_project,
+    projects,
+)
 from immersive_library.validators.common import (
     MaxSizeValidator,
     ReadOnlyValidator,
@@ -36,6 +41,17 @@ projects["mca"].validators = [
     InvalidReportValidator(),
     ReportValidator(lambda reason: reason in ["DEFAULT", "INVALID"]),
 ]
+projects["mca"].warm_up_requests = [
+    ("list_content_page", {"order": "likes", "descending": True, "limit": 100}),
+    ("list_content_page", {"order": "date", "descending": True, "limit": 100}),
+    ("list_project_tags", {}),
+    ("get_statistics", {}),
+    ("get_users", {"order": "likes_received", "descending": True}),
+]
+projects["mca"].bundles = {
+    "all": BundleFilter(),
+    "popular": BundleFilter(min_likes=10),
+}
 
 # Add Immersive Furniture specific validators
 projects["furniture"] = Project()
@@ -43,5 +59,14 @@ projects["furniture"].validators = [
     TitleLengthValidator(),
     MaxSizeValidator(262144),
 ]
+projects["furniture"].warm_up_requests = [
+    ("list_content_page", {"order": "likes", "descending": True, "limit": 100}),
+    ("list_project_tags", {}),
+    ("get_statistics", {}),
+]
+projects["furniture"].bundles = {
+    "all": BundleFilter(),
+    "popular": BundleFilter(min_likes=10),
+}
 
 assert app
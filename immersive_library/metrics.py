@@ -0,0 +1,38 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+LOGIN_LATENCY = Histogram(
+    "immersive_library_login_seconds",
+    "Time spent verifying a Google ID token and logging in the user.",
+    ["outcome"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+
+WARMUP_RUNS = Counter(
+    "immersive_library_warmup_runs",
+    "Cache warm-up runs, by what triggered them.",
+    ["reason"],
+)
+
+WARMUP_KEYS = Counter(
+    "immersive_library_warmup_keys",
+    "Cache keys precomputed by the warm-up job.",
+    ["result"],
+)
+
+WARMUP_PENDING = Gauge(
+    "immersive_library_warmup_pending",
+    "Cache keys left in the current warm-up run.",
+    multiprocess_mode="livesum",
+)
+
+CACHE_DEGRADED = Gauge(
+    "immersive_library_cache_degraded",
+    "Whether the response cache runs on the in-process fallback instead of Redis.",
+    multiprocess_mode="max",
+)
+
+CACHE_ERRORS = Counter(
+    "immersive_library_cache_errors",
+    "Failed Redis operations of the response cache.",
+    ["operation"],
+)
@@ -1,7 +1,9 @@
 import base64
-from typing import Any, Dict, List, Optional, Union
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
-from pydantic import BaseModel
+import orjson
+from pydantic import BaseModel, Field, PrivateAttr, field_validator
 
 
 class ContentUpload(BaseModel):
@@ -10,12 +12,87 @@ class ContentUpload(BaseModel):
     data: str
     tags: Optional[List[str]] = None
 
+    @field_validator("meta")
+    @classmethod
+    def canonicalize_meta(cls, meta: str) -> str:
+        """
+        Meta is stored compact and known-valid, so it can be embedded in responses as-is
+        """
+        try:
+            parsed = orjson.loads(meta)
+        except orjson.JSONDecodeError as e:
+            raise ValueError(f"Meta is not valid JSON: {e}")
+        if not isinstance(parsed, dict):
+            raise ValueError("Meta must be a JSON object")
+        return orjson.dumps(parsed).decode()
+
+    # The decoded data, decoded at most once per request
+    _payload: Optional[bytes] = PrivateAttr(None)
+
+    # Values derived from the payload, by name
+    _artifacts: Dict[str, Any] = PrivateAttr(default_factory=dict)
+    _artifact_locks: Dict[str, threading.Lock] = PrivateAttr(default_factory=dict)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @classmethod
+    def from_payload(cls, payload: bytes, **fields) -> "ContentUpload":
+        """
+        Creates an upload from raw data, skipping base64 altogether
+        """
+        content = cls(data="", **fields)
+        content._payload = payload
+        return content
+
     @property
     def payload(self) -> bytes:
-        return base64.b64decode(self.data)
+        if self._payload is None:
+            self._payload = base64.b64decode(self.data)
+        return self._payload
+
+    def get_artifact(self, name: str, factory: Callable[[bytes], Any]) -> Any:
+        """
+        A value derived from the payload, e.g. the decoded image, computed once and shared between validators.
+        Thread-safe, validators may ask for the same artifact concurrently.
+        """
+        with self._lock:
+            lock = self._artifact_locks.setdefault(name, threading.Lock())
+        with lock:
+            if name not in self._artifacts:
+                self._artifacts[name] = factory(self.payload)
+            return self._artifacts[name]
 
     def replace(self, data: bytes):
-        self.data = base64.b64encode(data).decode()
+        # The encoded data is not needed anymore once replaced
+        self._payload = data
+        self.data = ""
+        self._artifacts = {}
+
+
+class ContentEdit(BaseModel):
+    offset: int = Field(ge=0)
+    length: int = Field(ge=0)
+    data: str = ""
+
+    @property
+    def payload(self) -> bytes:
+        return base64.b64decode(self.data)
+
+
+class ContentPatch(BaseModel):
+    version: int
+    edits: List[ContentEdit] = []
+    title: Optional[str] = None
+    meta: Optional[str] = None
+    tags: Optional[List[str]] = None
+
+    @field_validator("meta")
+    @classmethod
+    def canonicalize_meta(cls, meta: Optional[str]) -> Optional[str]:
+        return None if meta is None else ContentUpload.canonicalize_meta(meta)
+
+
+class ContentBatch(BaseModel):
+    contentids: List[int]
 
 
 class Content(BaseModel):
@@ -76,6 +153,27 @@ class ContentListSuccess(BaseModel):
     contents: List[LiteContent]
 
 
+class ContentBatchSuccess(BaseModel):
+    contents: List[Content]
+
+
+class Change(BaseModel):
+    contentid: int
+    deleted: bool
+    content: Optional[LiteContent] = None
+
+
+class ChangesSuccess(BaseModel):
+    changes: List[Change]
+    cursor: int
+    more: bool
+
+
+class ManifestSuccess(BaseModel):
+    shard_size: int
+    contents: List[Tuple[int, int, int]]
+
+
 class UserSuccess(BaseModel):
     user: User
 
@@ -104,6 +202,10 @@ class ContentIdSuccess(BaseModel):
     contentid: int
 
 
+class ContentVersionSuccess(BaseModel):
+    version: int
+
+
 class BanEntry(BaseModel):
     userid: int
     username: str
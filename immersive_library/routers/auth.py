@@ -1,15 +1,16 @@
 import base64
 import json
 import os
+import time
 from typing import Annotated, Optional
 
 from fastapi import APIRouter, Form, Header, HTTPException, Query, Request
-from google.auth.transport import requests
-from google.oauth2 import id_token
 from orjson import orjson
 from starlette.responses import HTMLResponse, RedirectResponse, Response
 
 from immersive_library.common import database, templates
+from immersive_library.id_tokens import id_token_verifier
+from immersive_library.metrics import LOGIN_LATENCY
 from immersive_library.models import (
     Error,
     IsAuthResponse,
@@ -53,22 +54,26 @@ async def auth(
     if len(token) < 16:
         raise HTTPException(400, "Token should at very least contain 16 bytes")
 
+    start = time.perf_counter()
+    outcome = "error"
     try:
-        info = id_token.verify_oauth2_token(
-            credential, requests.Request(), os.getenv("CLIENT_ID")
-        )
+        info = await id_token_verifier.verify(credential)
 
         userid = info["sub"]
 
         # Update session for user
         await login_user(database, userid, username, token)
+        outcome = "success"
 
         if return_to is not None:
             return RedirectResponse(return_to, status_code=303)
 
         return templates.TemplateResponse("success.jinja", {"request": request})
     except ValueError:
+        outcome = "rejected"
         raise HTTPException(401, "Validation failed")
+    finally:
+        LOGIN_LATENCY.labels(outcome).observe(time.perf_counter() - start)
 
 
 @router.get("/v1/auth", summary="Check if user is authenticated")
@@ -0,0 +1,42 @@
+import os
+
+from fastapi import APIRouter, HTTPException, Query
+from starlette.responses import FileResponse
+
+from immersive_library.bundles import BundleFormat, get_bundle_path
+from immersive_library.common import get_project
+from immersive_library.models import Error
+
+router = APIRouter(tags=["Content"])
+
+
+@router.get(
+    "/v2/bundles/{project}/{name}",
+    response_class=FileResponse,
+    responses={
+        200: {"content": {"application/zip": {}, "application/x-tar": {}}},
+        206: {"description": "Partial content"},
+        404: {"model": Error},
+    },
+)
+async def get_bundle(
+    project: str,
+    name: str,
+    bundle_format: BundleFormat = Query(BundleFormat.ZIP, alias="format"),
+) -> FileResponse:
+    """
+    Downloads every content of a bundle as one archive, the raw data as files plus an index.json with the content.
+    Bundles are rebuilt in the background once the project changes. Supports Range requests to resume a download.
+    """
+    if name not in get_project(project).bundles:
+        raise HTTPException(404, "Bundle does not exist")
+
+    path = get_bundle_path(project, name, bundle_format)
+    if not os.path.exists(path):
+        raise HTTPException(404, "Bundle has not been built yet")
+
+    return FileResponse(
+        path,
+        media_type=bundle_format.media_type,
+        filename=os.path.basename(path),
+    )
@@ -0,0 +1,95 @@
+import orjson
+from fastapi import APIRouter, HTTPException, Query
+from starlette.responses import Response
+
+from immersive_library.changes import get_horizon
+from immersive_library.common import database
+from immersive_library.models import ChangesSuccess, Error
+from immersive_library.utils import (
+    ALL_JOINS,
+    LIST_FIELDS,
+    LITE_CONTENT_FIELDS,
+    get_content_dict,
+    get_select,
+)
+
+router = APIRouter(tags=["Content"])
+
+
+@router.get(
+    "/v2/changes/{project}",
+    response_model=ChangesSuccess,
+    response_model_exclude_none=True,
+    responses={410: {"model": Error}},
+)
+async def list_changes(
+    project: str,
+    since: int = Query(
+        0,
+        ge=0,
+        description="The cursor returned by the previous call, 0 for a full sync.",
+    ),
+    limit: int = Query(
+        500, ge=1, le=5000, description="The maximum amount of changes to return."
+    ),
+    include_meta: bool = Query(False, description="Include the meta field in upserts."),
+) -> Response:
+    """
+    Content added, changed or deleted since the cursor, in commit order.
+    Each content appears once with its current state, or as a tombstone if it has been deleted.
+    Keep calling with the returned cursor while more is true.
+    """
+    if 0 < since < await get_horizon(project):
+        raise HTTPException(410, "Cursor expired, resync from the start")
+
+    # The deleted flag is taken from the latest entry of each content
+    rows = await database.fetch_all(
+        """
+        SELECT contentid, max(seq) AS seq, deleted
+        FROM changes
+        WHERE project = :project AND seq > :since
+        GROUP BY contentid
+        ORDER BY seq
+        LIMIT :limit
+        """,
+        {"project": project, "since": since, "limit": limit + 1},
+    )
+    more = len(rows) > limit
+    rows = rows[:limit]
+
+    # The current state of everything which still exists
+    fields = LIST_FIELDS if include_meta else LITE_CONTENT_FIELDS
+    contents = await database.fetch_all(
+        get_select(fields, ALL_JOINS)
+        + """
+        WHERE c.project = :project
+          AND c.oid IN (SELECT value FROM json_each(:contentids))
+        """,
+        {
+            "project": project,
+            "contentids": orjson.dumps([r["contentid"] for r in rows]).decode(),
+        },
+    )
+    current = {c["contentid"]: get_content_dict(c, fields) for c in contents}
+
+    changes = [
+        {
+            "contentid": r["contentid"],
+            "deleted": False,
+            "content": current[r["contentid"]],
+        }
+        if r["contentid"] in current and not r["deleted"]
+        else {"contentid": r["contentid"], "deleted": True}
+        for r in rows
+    ]
+
+    return Response(
+        orjson.dumps(
+            {
+                "changes": changes,
+                "cursor": rows[-1]["seq"] if rows else since,
+                "more": more,
+            }
+        ),
+        media_type="application/json",
+    )
@@ -1,31 +1,63 @@
+import asyncio
+import os
 import time
 from enum import Enum
 from pathlib import Path
-from typing import Optional, Union
+from typing import List, Optional, Tuple, Union
 
+import orjson
+from databases.interfaces import Record
 from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
-from fastapi_cache.decorator import cache
-from starlette.responses import Response
+from pydantic import ValidationError
+from starlette.datastructures import UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
+from starlette.responses import Response, StreamingResponse
 
+from immersive_library.blobs import open_content_blob
+from immersive_library.caching import RawJsonCoder, cache, get_key, get_many, set_many
+from immersive_library.changes import record_change
 from immersive_library.common import database, get_project, projects
+from immersive_library.encoding import (
+    ALTERNATIVE_RESPONSES,
+    ResponseFormat,
+    decode_document,
+    encode_document,
+    encoded_response,
+    join_documents,
+    negotiate_format,
+    unwrap_document,
+)
 from immersive_library.models import (
+    ContentBatch,
+    ContentBatchSuccess,
     ContentIdSuccess,
     ContentListSuccess,
+    ContentPatch,
     ContentSuccess,
     ContentUpload,
+    ContentVersionSuccess,
     Error,
     PlainSuccess,
     ProjectListSuccess,
     ProjectSummary,
 )
 from immersive_library.rendering import render_headless_png
+from immersive_library.routers.manifest import invalidate_manifest
 from immersive_library.utils import (
+    ALL_FIELDS,
+    LIST_FIELDS,
+    LITE_CONTENT_FIELDS,
+    apply_edits,
+    encode_contents,
+    etag_matches,
     exists,
-    fetch_content,
-    get_base_select,
+    get_content_dict,
     get_lite_content_class,
+    get_select,
     logged_in_guard,
     owner_guard,
+    parse_fields,
+    parse_range,
     set_tags,
     token_to_userid,
     update_precomputation,
@@ -64,6 +96,54 @@ RENDER_PRESET_SIZES: dict[RenderPreset, tuple[int, int]] = {
 
 CACHE_DIR = Path("data/cache")
 
+# Raw data beyond the project's size limit is streamed in chunks of this size
+BLOB_CHUNK_SIZE = 65536
+
+# Columns to order by, recommendations are ordered by a seeded shuffle instead
+ORDER_COLUMNS = {
+    ContentOrder.DATE: "c.oid",
+    ContentOrder.LIKES: "precomputation.likes",
+    ContentOrder.TITLE: "c.title",
+    ContentOrder.REPORTS: "precomputation.reports",
+}
+
+# Seconds a single content stays cached
+CONTENT_EXPIRE = 60
+
+# Contents fetched per batch request
+CONTENT_BATCH_LIMIT = int(os.getenv("CONTENT_BATCH_LIMIT", "100"))
+
+# Largest binary upload for projects without a size limit
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(16 * 1024 * 1024)))
+
+# Allowance for the title, meta, tags and multipart framing of an upload
+UPLOAD_FIELDS_SIZE = 65536
+
+UPLOAD_MAX_FIELDS = 64
+
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["title", "data"],
+                    "properties": {
+                        "title": {"type": "string"},
+                        "meta": {"type": "string", "default": "{}"},
+                        "tags": {"type": "array", "items": {"type": "string"}},
+                        "data": {"type": "string", "format": "binary"},
+                    },
+                }
+            }
+        },
+    }
+}
+
+# Refill a personally filtered page from the next one once this fraction is hidden
+REFILL_THRESHOLD = 0.2
+
 
 @router.get(
     "/v1/content",
@@ -87,9 +167,11 @@ async def list_projects() -> ProjectListSuccess:
     "/v2/content/{project}",
     response_model_exclude_none=True,
     response_model=ContentListSuccess,
+    responses=ALTERNATIVE_RESPONSES,
 )
-@cache(expire=60)
 async def list_content_v2(
+    request: Request,
+    response: Response,
     project: str,
     track: TrackEnum = TrackEnum.ALL,
     userid: Optional[None] = Query(
@@ -131,26 +213,162 @@ async def list_content_v2(
         False,
         description="Parse the meta field and return it as a dict rather than a JSON encoded string.",
     ),
+    fields: Optional[str] = Query(
+        None,
+        description=(
+            "Only include the given comma-separated fields, contentid is always "
+            "included. Defaults to every field but meta."
+        ),
+    ),
     token: Optional[str] = None,
     authorization: str = Header(None),
+    accept: Optional[str] = Header(None),
 ) -> ContentListSuccess:
-    return await inner_list_content_v2(
+    response_format = negotiate_format(accept)
+    fields = parse_fields(
+        fields, LIST_FIELDS, LITE_CONTENT_FIELDS, ("meta",) if include_meta else ()
+    )
+
+    # Resolve the viewer, only a few options actually depend on who is asking
+    userid = userid or await token_to_userid(database, token, authorization)
+    personal = track != TrackEnum.ALL or order == ContentOrder.RECOMMENDATIONS
+    hide_reported = token is not None and userid is not None
+    shared = not personal and not hide_reported
+
+    page = await list_content_page(
+        project,
+        track,
+        userid if personal else None,
+        normalize_terms(whitelist, blacklist),
+        filter_banned,
+        filter_reported,
+        offset,
+        limit,
+        order,
+        descending,
+        ",".join(fields),
+        parse_meta and "meta" in fields,
+        response_format,
+        request=request if shared else None,
+        response=response if shared else None,
+    )
+
+    # Not modified
+    if isinstance(page, Response):
+        return page
+
+    if not hide_reported:
+        return encoded_response(page, response, response_format)
+
+    # Hide personally reported content from the shared page
+    contents = decode_document(page, response_format)["contents"]
+    hidden = await get_reported(userid, [c["contentid"] for c in contents])
+    visible = [c for c in contents if c["contentid"] not in hidden]
+
+    # Top up from the next page if too much has been removed, at the cost of
+    # possibly repeating some of it on the next page
+    if len(contents) == limit and limit - len(visible) > limit * REFILL_THRESHOLD:
+        next_page = await list_content_page(
+            project,
+            track,
+            userid if personal else None,
+            normalize_terms(whitelist, blacklist),
+            filter_banned,
+            filter_reported,
+            offset + limit,
+            limit,
+            order,
+            descending,
+            ",".join(fields),
+            parse_meta and "meta" in fields,
+            response_format,
+        )
+        refill = decode_document(next_page, response_format)["contents"]
+        hidden = await get_reported(userid, [c["contentid"] for c in refill])
+        visible += [c for c in refill if c["contentid"] not in hidden]
+        visible = visible[:limit]
+
+    return encoded_response(
+        encode_document({"contents": visible}, response_format),
+        response,
+        response_format,
+    )
+
+
+def normalize_terms(
+    whitelist: Optional[str], blacklist: Optional[str]
+) -> Optional[str]:
+    """
+    Merges the deprecated blacklist into the whitelist and sorts its terms
+    """
+    terms = [v.strip() for v in whitelist.split(",")] if whitelist else []
+    if blacklist:
+        terms.extend(
+            f"-#{term.strip()}" for term in blacklist.split(",") if term.strip()
+        )
+    terms = sorted(set(term for term in terms if term))
+    return ",".join(terms) if terms else None
+
+
+async def get_reported(userid: int, contentids: list[int]) -> set[int]:
+    """
+    Return which of the given content the user has personally reported
+    """
+    if not contentids:
+        return set()
+    rows = await database.fetch_all(
+        """
+        SELECT contentid
+        FROM reports
+        WHERE userid = :userid
+          AND reason = 'DEFAULT'
+          AND contentid IN (SELECT value FROM json_each(:contentids))
+        """,
+        {"userid": userid, "contentids": orjson.dumps(contentids).decode()},
+    )
+    return {row[0] for row in rows}
+
+
+@cache(expire=60, coder=RawJsonCoder, warm_up=True)
+async def list_content_page(
+    project: str,
+    track: TrackEnum = TrackEnum.ALL,
+    userid: Optional[int] = None,
+    whitelist: Optional[str] = None,
+    filter_banned: bool = True,
+    filter_reported: bool = True,
+    offset: int = 0,
+    limit: int = 10,
+    order: ContentOrder = ContentOrder.DATE,
+    descending: bool = False,
+    fields: str = ",".join(LITE_CONTENT_FIELDS),
+    parse_meta: bool = False,
+    response_format: ResponseFormat = ResponseFormat.JSON,
+    request: Request = None,
+    response: Response = None,
+) -> bytes:
+    """
+    A page without the personal report filter, shared by everyone asking for the same options.
+    Encoded as ContentListSuccess directly from the rows, cached per format.
+    :param userid: The user whose likes or submissions to list, or whose recommendations to shuffle.
+    :param fields: The canonical, comma-separated fields to include.
+    """
+    fields = tuple(fields.split(","))
+    content = await fetch_content_list(
         project,
         track,
         userid,
         whitelist,
-        blacklist,
+        None,
         filter_banned,
         filter_reported,
         offset,
         limit,
         order,
         descending,
-        include_meta,
-        parse_meta,
-        token,
-        authorization,
+        fields,
     )
+    return encode_contents(content, fields, parse_meta, response_format)
 
 
 async def inner_list_content_v2(
@@ -170,11 +388,51 @@ async def inner_list_content_v2(
     token: Optional[str] = None,
     authorization: str = Header(None),
 ) -> ContentListSuccess:
+    content = await fetch_content_list(
+        project,
+        track,
+        userid,
+        whitelist,
+        blacklist,
+        filter_banned,
+        filter_reported,
+        offset,
+        limit,
+        order,
+        descending,
+        LIST_FIELDS if include_meta else LITE_CONTENT_FIELDS,
+        token,
+        authorization,
+    )
+
+    # Convert to content accessors, which are more lightweight than the actual content instances
+    contents = [get_lite_content_class(c, include_meta, parse_meta) for c in content]
+
+    return ContentListSuccess(contents=contents)
+
+
+async def fetch_content_list(
+    project: str,
+    track: TrackEnum = TrackEnum.ALL,
+    userid: Optional[int] = None,
+    whitelist: Optional[str] = None,
+    blacklist: Optional[str] = None,
+    filter_banned: bool = True,
+    filter_reported: bool = True,
+    offset: int = 0,
+    limit: int = 100,
+    order: ContentOrder = ContentOrder.DATE,
+    descending: bool = False,
+    fields: Tuple[str, ...] = LITE_CONTENT_FIELDS,
+    token: Optional[str] = None,
+    authorization: Optional[str] = None,
+) -> List[Record]:
     # Use me user if none is provided
     userid = userid or await token_to_userid(database, token, authorization)
 
-    prompt = get_base_select(False, include_meta)
     values: dict[str, Union[str, int]] = {"project": project}
+    joins = set()
+    prompt = ""
 
     # Filter for a specific track
     if track == TrackEnum.ALL:
@@ -201,10 +459,12 @@ async def inner_list_content_v2(
     # Remove content from banned users
     if filter_banned:
         prompt += "\n AND NOT users.banned"
+        joins.add("users")
 
     # Remove reported content
     if filter_reported:
         prompt += "\n AND 1.0 + likes / 10.0 - reports >= 0.0"
+        joins.add("precomputation")
 
     whitelist_terms = (
         [v.strip() for v in whitelist.split(",") if v.strip()] if whitelist else []
@@ -223,8 +483,9 @@ async def inner_list_content_v2(
         search_term = term[1:].strip() if negated else term
 
         if search_term.startswith("@"):
-            condition = f"username = :{parameter}"
+            condition = f"users.username = :{parameter}"
             values[parameter] = search_term[1:].strip()
+            joins.add("users")
         elif search_term.startswith("#"):
             condition = f"""EXISTS (
                     SELECT 1 FROM tags AS whitelist_tags_{index}
@@ -233,65 +494,291 @@ async def inner_list_content_v2(
                 )"""
             values[parameter] = search_term[1:].strip()
         elif search_term.startswith("~"):
-            condition = f"title LIKE :{parameter}"
+            condition = f"c.title LIKE :{parameter}"
             values[parameter] = f"%{search_term[1:].strip()}%"
         else:
             condition = (
-                f"(username LIKE :{parameter} OR title LIKE :{parameter} "
-                f"OR tags LIKE :{parameter})"
+                f"(users.username LIKE :{parameter} OR c.title LIKE :{parameter} "
+                f"OR precomputation.tags LIKE :{parameter})"
             )
             values[parameter] = f"%{search_term}%"
+            joins.update(("users", "precomputation"))
 
         prompt += f"\n AND {'NOT ' if negated else ''}{condition}"
 
     # Order by
     if order == ContentOrder.RECOMMENDATIONS:
         prompt += (
-            "\n ORDER BY (likes + :like_norm) * ABS(((:seed + c.oid) * 1103515245 + 12345) - 2147483648 * CAST(((:seed + c.oid) * 1103515245 + 12345) / 2147483648 AS INTEGER)) / 2147483647.0 "
+            "\n ORDER BY (precomputation.likes + :like_norm) * ABS(((:seed + c.oid) * 1103515245 + 12345) - 2147483648 * CAST(((:seed + c.oid) * 1103515245 + 12345) / 2147483648 AS INTEGER)) / 2147483647.0 "
             + ("DESC" if descending else "ASC")
         )
         values["seed"] = (0 if userid is None else userid) + int(time.time() / 86400)
         values["like_norm"] = 100
+        joins.add("precomputation")
     else:
-        prompt += (
-            f"\n ORDER BY {'c.oid' if order == ContentOrder.DATE else order.name} "
-            + ("DESC" if descending else "ASC")
+        prompt += f"\n ORDER BY {ORDER_COLUMNS[order]} " + (
+            "DESC" if descending else "ASC"
         )
+        if order in (ContentOrder.LIKES, ContentOrder.REPORTS):
+            joins.add("precomputation")
 
     # Limit
     prompt += "\n LIMIT :limit OFFSET :offset"
     values["limit"] = limit
     values["offset"] = offset
 
-    # Fetch
-    content = await database.fetch_all(prompt, values)
-
-    # Convert to content accessors, which are more lightweight than the actual content instances
-    contents = [get_lite_content_class(c, include_meta, parse_meta) for c in content]
-
-    return ContentListSuccess(contents=contents)
+    # Fetch, joining only what the fields, filters and order refer to
+    return await database.fetch_all(
+        get_select(fields, frozenset(joins)) + prompt, values
+    )
 
 
-@router.get("/v1/content/{project}/{contentid}", response_model=ContentSuccess)
-@cache(expire=60)
+@router.get(
+    "/v1/content/{project}/{contentid}",
+    response_model=ContentSuccess,
+    responses={404: {"model": Error}, **ALTERNATIVE_RESPONSES},
+)
 async def get_content(
-    project: str, contentid: int, parse_meta: bool = False, version: int = 0
+    request: Request,
+    response: Response,
+    project: str,
+    contentid: int,
+    parse_meta: bool = False,
+    version: int = 0,
+    fields: Optional[str] = Query(
+        None,
+        description=(
+            "Only include the given comma-separated fields, contentid is always "
+            "included. Defaults to every field."
+        ),
+    ),
+    accept: Optional[str] = Header(None),
 ) -> ContentSuccess:
-    assert project
+    response_format = negotiate_format(accept)
+    content = await get_content_document(
+        project,
+        contentid,
+        parse_meta,
+        version,
+        ",".join(parse_fields(fields, ALL_FIELDS, ALL_FIELDS)),
+        response_format,
+        request=request,
+        response=response,
+    )
+
+    # Not modified
+    if isinstance(content, Response):
+        return content
+
+    return encoded_response(content, response, response_format)
+
+
+@cache(expire=CONTENT_EXPIRE, coder=RawJsonCoder)
+async def get_content_document(
+    project: str,
+    contentid: int,
+    parse_meta: bool = False,
+    version: int = 0,
+    fields: str = ",".join(ALL_FIELDS),
+    response_format: ResponseFormat = ResponseFormat.JSON,
+    request: Request = None,
+    response: Response = None,
+) -> bytes:
+    """
+    A single content encoded as ContentSuccess directly from the row, cached per format.
+    :param version: Not used for the lookup, but lets clients bypass an outdated cache entry.
+    :param fields: The canonical, comma-separated fields to include.
+    """
     assert version is not None
 
-    content = await fetch_content(contentid, parse_meta)
+    fields = tuple(fields.split(","))
+    content = await database.fetch_one(
+        get_select(fields) + "WHERE c.oid = :contentid AND c.project = :project",
+        {"contentid": contentid, "project": project},
+    )
+
+    if content is None:
+        raise HTTPException(404, "Content not found")
+
+    return encode_content_document(content, fields, parse_meta, response_format)
+
 
-    return ContentSuccess(content=content)
+def encode_content_document(
+    content: Record,
+    fields: Tuple[str, ...],
+    parse_meta: bool,
+    response_format: ResponseFormat,
+) -> bytes:
+    return encode_document(
+        {
+            "content": get_content_dict(
+                content, fields, parse_meta, response_format.binary
+            )
+        },
+        response_format,
+    )
 
 
 @router.post(
-    "/v1/content/{project}",
-    responses={401: {"model": Error}, 428: {"model": Error}, 400: {"model": Error}},
+    "/v2/content/{project}/batch",
+    response_model=ContentBatchSuccess,
+    response_model_exclude_none=True,
+    responses={400: {"model": Error}, **ALTERNATIVE_RESPONSES},
 )
-async def add_content(
-    project: str, content: ContentUpload, userid: int = Depends(logged_in_guard)
-) -> ContentIdSuccess:
+async def get_content_batch(
+    response: Response,
+    project: str,
+    batch: ContentBatch,
+    parse_meta: bool = False,
+    include_data: bool = Query(False, description="Include the data field."),
+    fields: Optional[str] = Query(
+        None,
+        description=(
+            "Only include the given comma-separated fields, contentid is always "
+            "included. Defaults to every field but data."
+        ),
+    ),
+    accept: Optional[str] = Header(None),
+) -> ContentBatchSuccess:
+    """
+    Several contents in one request, in the requested order. Unknown ids are left out.
+    Shares its cache entries with /v1/content/{project}/{contentid}.
+    """
+    contentids = list(dict.fromkeys(batch.contentids))
+    if len(contentids) > CONTENT_BATCH_LIMIT:
+        raise HTTPException(
+            400, f"At most {CONTENT_BATCH_LIMIT} contents per batch allowed"
+        )
+
+    response_format = negotiate_format(accept)
+    fields = parse_fields(
+        fields, ALL_FIELDS, LIST_FIELDS, ("data",) if include_data else ()
+    )
+
+    # Resolve what is cached in one round trip
+    keys = {
+        contentid: get_key(
+            get_content_document,
+            project=project,
+            contentid=contentid,
+            parse_meta=parse_meta,
+            fields=",".join(fields),
+            response_format=response_format,
+        )
+        for contentid in contentids
+    }
+    documents = dict(zip(contentids, await get_many(list(keys.values()))))
+
+    # Fetch the rest with a single query
+    missing = [contentid for contentid, d in documents.items() if d is None]
+    if missing:
+        rows = await database.fetch_all(
+            get_select(fields)
+            + "WHERE c.oid IN (SELECT value FROM json_each(:contentids)) AND c.project = :project",
+            {"contentids": orjson.dumps(missing).decode(), "project": project},
+        )
+        fetched = {
+            row["contentid"]: encode_content_document(
+                row, fields, parse_meta, response_format
+            )
+            for row in rows
+        }
+        await set_many(
+            {keys[contentid]: d for contentid, d in fetched.items()}, CONTENT_EXPIRE
+        )
+        documents.update(fetched)
+
+    return encoded_response(
+        join_documents(
+            "contents",
+            [
+                unwrap_document(d, "content", response_format)
+                for d in documents.values()
+                if d is not None
+            ],
+            response_format,
+        ),
+        response,
+        response_format,
+    )
+
+
+@router.get(
+    "/v1/content/{project}/{contentid}/data",
+    response_class=Response,
+    responses={404: {"model": Error}, 416: {"model": Error}},
+)
+async def get_content_data(
+    project: str,
+    contentid: int,
+    byte_range: Optional[str] = Header(None, alias="Range"),
+    if_none_match: Optional[str] = Header(None),
+) -> Response:
+    """
+    The raw data, read incrementally from the database and supporting single byte ranges.
+    """
+    # Data within the project's size limit is read at once, so no lock is held while sending
+    preload_size = max(BLOB_CHUNK_SIZE, get_project(project).max_upload_size or 0)
+    blob = await asyncio.to_thread(open_content_blob, project, contentid, preload_size)
+    if blob is None:
+        raise HTTPException(404, "Content not found")
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "public, max-age=60",
+        "ETag": f'"{contentid}-{blob.version}"',
+    }
+
+    streaming = False
+    try:
+        if etag_matches(if_none_match, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+
+        interval = parse_range(byte_range, blob.size)
+        if interval is None:
+            start, end = 0, blob.size
+            status_code = 200
+        else:
+            start, end = interval
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{blob.size}"
+        headers["Content-Length"] = str(end - start)
+
+        # Preloaded or small enough to read in one go
+        if blob.data is not None or end - start <= BLOB_CHUNK_SIZE:
+            body = await asyncio.to_thread(blob.read, start, end - start)
+            return Response(
+                body,
+                status_code=status_code,
+                media_type=blob.media_type,
+                headers=headers,
+            )
+
+        async def stream():
+            try:
+                for offset in range(start, end, BLOB_CHUNK_SIZE):
+                    length = min(BLOB_CHUNK_SIZE, end - offset)
+                    yield await asyncio.to_thread(blob.read, offset, length)
+            finally:
+                await asyncio.to_thread(blob.close)
+
+        streaming = True
+        return StreamingResponse(
+            stream(),
+            status_code=status_code,
+            media_type=blob.media_type,
+            headers=headers,
+        )
+    finally:
+        if not streaming:
+            await asyncio.to_thread(blob.close)
+
+
+async def store_content(project: str, userid: int, content: ContentUpload) -> int:
+    """
+    Validates and stores a new content
+    :return: The new content id.
+    """
     # Check for duplicates
     if await exists(
         database,
@@ -321,30 +808,131 @@ async def add_content(
     await get_project(project).call("post_upload", database, userid, contentid)
 
     await update_precomputation(database, contentid)
+    await record_change(database, contentid)
+    await invalidate_manifest(project, contentid)
 
-    return ContentIdSuccess(contentid=contentid)
+    return contentid
 
 
-@router.put("/v1/content/{project}/{contentid}", responses={401: {"model": Error}})
-async def update_content(
+async def read_upload(request: Request, project: str) -> ContentUpload:
+    """
+    Reads a multipart upload, rejecting it as soon as it exceeds the project's size limit
+    """
+    max_size = get_project(project).max_upload_size or MAX_UPLOAD_SIZE
+    limit = max_size + UPLOAD_FIELDS_SIZE
+
+    content_type = request.headers.get("content-type", "")
+    if not content_type.startswith("multipart/form-data"):
+        raise HTTPException(415, "Expected multipart/form-data")
+
+    # Announced sizes are rejected before reading anything
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > limit:
+        raise HTTPException(413, "Content too large")
+
+    async def stream():
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > limit:
+                raise HTTPException(413, "Content too large")
+            yield chunk
+
+    try:
+        form = await MultiPartParser(
+            request.headers,
+            stream(),
+            max_files=1,
+            max_fields=UPLOAD_MAX_FIELDS,
+            max_part_size=UPLOAD_FIELDS_SIZE,
+        ).parse()
+    except MultiPartException as e:
+        raise HTTPException(400, e.message)
+
+    try:
+        file = form.get("data")
+        if not isinstance(file, UploadFile):
+            raise HTTPException(400, "Missing data file")
+        payload = await file.read(max_size + 1)
+        if len(payload) > max_size:
+            raise HTTPException(413, "Content too large")
+
+        return ContentUpload.from_payload(
+            payload,
+            title=form.get("title"),
+            meta=form.get("meta", "{}"),
+            tags=form.getlist("tags") or None,
+        )
+    except ValidationError as e:
+        error = e.errors()[0]
+        raise HTTPException(400, f"{error['loc'][0]}: {error['msg']}")
+    finally:
+        await form.close()
+
+
+@router.post(
+    "/v1/content/{project}",
+    responses={401: {"model": Error}, 428: {"model": Error}, 400: {"model": Error}},
+)
+async def add_content(
+    project: str, content: ContentUpload, userid: int = Depends(logged_in_guard)
+) -> ContentIdSuccess:
+    return ContentIdSuccess(contentid=await store_content(project, userid, content))
+
+
+@router.post(
+    "/v2/content/{project}",
+    responses={
+        401: {"model": Error},
+        428: {"model": Error},
+        400: {"model": Error},
+        413: {"model": Error},
+        415: {"model": Error},
+    },
+    openapi_extra=UPLOAD_REQUEST_BODY,
+)
+async def upload_content(
+    request: Request, project: str, userid: int = Depends(logged_in_guard)
+) -> ContentIdSuccess:
+    """
+    Uploads content as multipart form, with the raw data as file instead of base64.
+    """
+    content = await read_upload(request, project)
+    return ContentIdSuccess(contentid=await store_content(project, userid, content))
+
+
+async def store_update(
     project: str,
     contentid: int,
+    userid: int,
     content: ContentUpload,
-    userid: int = Depends(owner_guard),
-) -> PlainSuccess:
+    version: Optional[int] = None,
+) -> Optional[int]:
+    """
+    Validates and stores a new revision of a content
+    :param version: Only update if the content is still at this version.
+    :return: The new version, None if the content changed in the meantime.
+    """
     # Call validators for content verification
     await get_project(project).validate("pre_upload", database, userid, content)
 
-    await database.execute(
-        "UPDATE content SET title=:title, meta=:meta, data=:data, version=version+1 WHERE project=:project AND oid=:oid",
+    new_version = await database.fetch_val(
+        """
+        UPDATE content SET title=:title, meta=:meta, data=:data, version=version+1
+        WHERE project=:project AND oid=:oid AND (:version IS NULL OR version=:version)
+        RETURNING version
+        """,
         {
             "title": content.title,
             "meta": content.meta,
             "data": content.payload,
             "project": project,
             "oid": contentid,
+            "version": version,
         },
     )
+    if new_version is None:
+        return None
 
     if content.tags is not None:
         await set_tags(database, contentid, content.tags)
@@ -353,10 +941,93 @@ async def update_content(
     await get_project(project).call("post_upload", database, userid, contentid)
 
     await update_precomputation(database, contentid)
+    await record_change(database, contentid)
+    await invalidate_manifest(project, contentid)
+
+    return new_version
+
+
+@router.put("/v1/content/{project}/{contentid}", responses={401: {"model": Error}})
+async def update_content(
+    project: str,
+    contentid: int,
+    content: ContentUpload,
+    userid: int = Depends(owner_guard),
+) -> PlainSuccess:
+    await store_update(project, contentid, userid, content)
+
+    return PlainSuccess()
+
+
+@router.put(
+    "/v2/content/{project}/{contentid}",
+    responses={
+        401: {"model": Error},
+        400: {"model": Error},
+        413: {"model": Error},
+        415: {"model": Error},
+    },
+    openapi_extra=UPLOAD_REQUEST_BODY,
+)
+async def replace_content(
+    request: Request,
+    project: str,
+    contentid: int,
+    userid: int = Depends(owner_guard),
+) -> PlainSuccess:
+    """
+    Updates content from a multipart form, like the upload.
+    """
+    content = await read_upload(request, project)
+    await store_update(project, contentid, userid, content)
 
     return PlainSuccess()
 
 
+@router.patch(
+    "/v1/content/{project}/{contentid}",
+    responses={
+        400: {"model": Error},
+        401: {"model": Error},
+        404: {"model": Error},
+        409: {"model": Error},
+    },
+)
+async def patch_content(
+    project: str,
+    contentid: int,
+    patch: ContentPatch,
+    userid: int = Depends(owner_guard),
+) -> ContentVersionSuccess:
+    """
+    Updates a content by replacing byte ranges of its data, so only the changed parts are uploaded.
+    Title, meta and tags are left as they are unless given.
+    The edits are computed against the stated version and rejected if the content changed since.
+    """
+    current = await database.fetch_one(
+        "SELECT title, meta, data, version FROM content WHERE project=:project AND oid=:oid",
+        {"project": project, "oid": contentid},
+    )
+    if current is None:
+        raise HTTPException(404, "Content not found")
+    if current["version"] != patch.version:
+        raise HTTPException(409, f"Content is at version {current['version']}")
+
+    content = ContentUpload(
+        title=current["title"] if patch.title is None else patch.title,
+        meta=current["meta"] if patch.meta is None else patch.meta,
+        data="",
+        tags=patch.tags,
+    )
+    content.replace(apply_edits(current["data"] or b"", patch.edits))
+
+    version = await store_update(project, contentid, userid, content, patch.version)
+    if version is None:
+        raise HTTPException(409, "Content has been modified concurrently")
+
+    return ContentVersionSuccess(version=version)
+
+
 @router.delete("/v1/content/{project}/{contentid}", responses={401: {"model": Error}})
 async def delete_content(
     project: str, contentid: int, userid: int = Depends(owner_guard)
@@ -364,10 +1035,15 @@ async def delete_content(
     assert project
     assert userid
 
-    await database.execute(
-        "DELETE FROM content WHERE oid=:contentid",
-        {"contentid": contentid},
-    )
+    # The tombstone and the deletion become visible together
+    async with database.transaction():
+        await record_change(database, contentid, deleted=True)
+        await database.execute(
+            "DELETE FROM content WHERE oid=:contentid",
+            {"contentid": contentid},
+        )
+
+    await invalidate_manifest(project, contentid)
 
     return PlainSuccess()
 
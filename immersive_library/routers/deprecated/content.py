@@ -1,12 +1,18 @@
 from typing import Optional
 
-from fastapi import APIRouter
-from fastapi_cache.decorator import cache
+from fastapi import APIRouter, Header
+from starlette.responses import FileResponse, Response
 
+from immersive_library.encoding import encoded_response
 from immersive_library.models import (
     ContentListSuccess,
 )
-from immersive_library.routers.content import inner_list_content_v2
+from immersive_library.routers.content import list_content_page
+from immersive_library.snapshots import (
+    LEGACY_LIST_LIMIT,
+    get_legacy_whitelist,
+    get_snapshot,
+)
 
 router = APIRouter(tags=["Content"])
 
@@ -17,13 +23,31 @@ router = APIRouter(tags=["Content"])
     response_model_exclude_none=True,
     include_in_schema=False,
 )
-@cache(expire=60)
 async def list_content(
-    project: str, tag_filter: Optional[str] = None, invert_filter: bool = False
+    response: Response,
+    project: str,
+    tag_filter: Optional[str] = None,
+    invert_filter: bool = False,
+    accept_encoding: Optional[str] = Header(None),
 ) -> ContentListSuccess:
-    return await inner_list_content_v2(
-        project,
-        whitelist=None if invert_filter else tag_filter,
-        blacklist=tag_filter if invert_filter else None,
-        limit=500,
+    whitelist = get_legacy_whitelist(tag_filter, invert_filter)
+
+    # Common parameters are pre-rendered whenever the project changes
+    path = get_snapshot(project, whitelist)
+    if path is not None:
+        if "gzip" in (accept_encoding or ""):
+            return FileResponse(
+                path + ".gz",
+                media_type="application/json",
+                headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"},
+            )
+        return FileResponse(
+            path, media_type="application/json", headers={"Vary": "Accept-Encoding"}
+        )
+
+    # Shares its cached pages with the v2 endpoint, concurrent misses wait for a single query
+    # instead of each streaming from its own cursor, which would hold the read lock while sending
+    page = await list_content_page(
+        project, whitelist=whitelist, limit=LEGACY_LIST_LIMIT
     )
+    return encoded_response(page, response)
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException
-from fastapi_cache.decorator import cache
 
+from immersive_library.caching import cache
 from immersive_library.common import database
 from immersive_library.models import (
     Error,
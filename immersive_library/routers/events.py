@@ -0,0 +1,50 @@
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query
+from starlette.responses import StreamingResponse
+
+from immersive_library.events import (
+    EVENTS_MAX_CONNECTIONS,
+    EVENTS_RETRY_INTERVAL,
+    count_connections,
+    stream_events,
+)
+from immersive_library.models import Error
+
+router = APIRouter(tags=["Content"])
+
+
+@router.get(
+    "/v2/events/{project}",
+    response_class=StreamingResponse,
+    responses={
+        200: {"content": {"text/event-stream": {}}},
+        503: {"model": Error},
+    },
+)
+async def get_events(
+    project: str,
+    since: Optional[int] = Query(
+        None,
+        ge=0,
+        description="Replay the changes after this cursor first, as returned by /v2/changes.",
+    ),
+    last_event_id: Optional[int] = Header(None),
+) -> StreamingResponse:
+    """
+    Server-Sent Events stream of a project's content changes, one `change` event per upload, update, deletion, like or tag change.
+    The event id is the change log cursor, a reconnecting client resumes after the last event it received.
+    A `resync` event means events have been missed and the client should sync via /v2/changes.
+    """
+    if count_connections() >= EVENTS_MAX_CONNECTIONS:
+        raise HTTPException(
+            503,
+            "Too many event streams",
+            headers={"Retry-After": str(EVENTS_RETRY_INTERVAL)},
+        )
+
+    return StreamingResponse(
+        stream_events(project, last_event_id if last_event_id is not None else since),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,79 @@
+import os
+from typing import AsyncIterator
+
+import orjson
+from fastapi import APIRouter, Depends, Query
+from starlette.responses import StreamingResponse
+
+from immersive_library.common import database
+from immersive_library.models import Error
+from immersive_library.utils import (
+    ALL_FIELDS,
+    ALL_JOINS,
+    LIST_FIELDS,
+    export_guard,
+    get_content_dict,
+    get_select,
+)
+
+router = APIRouter(tags=["Admin"])
+
+# Rows read per query, each query only briefly holds the database's read lock
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+
+
+async def iterate_export(
+    project: str, after: int, include_data: bool
+) -> AsyncIterator[bytes]:
+    """
+    Yields one JSON line per content in id order, keeping at most one batch in memory
+    """
+    fields = ALL_FIELDS if include_data else LIST_FIELDS
+    query = (
+        get_select(fields, ALL_JOINS)
+        + "WHERE c.project = :project AND c.oid > :after ORDER BY c.oid LIMIT :limit"
+    )
+
+    while True:
+        # Fetched as a whole, so no cursor stays open while the lines are sent
+        rows = await database.fetch_all(
+            query, {"project": project, "after": after, "limit": EXPORT_BATCH_SIZE}
+        )
+        for row in rows:
+            yield orjson.dumps(
+                get_content_dict(row, fields, parse_meta=True),
+                option=orjson.OPT_APPEND_NEWLINE,
+            )
+
+        if len(rows) < EXPORT_BATCH_SIZE:
+            break
+        after = rows[-1]["contentid"]
+
+
+@router.get(
+    "/v2/export/{project}",
+    response_class=StreamingResponse,
+    dependencies=[Depends(export_guard)],
+    responses={
+        200: {"content": {"application/x-ndjson": {}}},
+        401: {"model": Error},
+        403: {"model": Error},
+    },
+)
+async def export_project(
+    project: str,
+    after: int = Query(
+        0,
+        ge=0,
+        description="Only export content with a larger id, pass the last received id to resume.",
+    ),
+    include_data: bool = Query(False, description="Include the base64 encoded data."),
+) -> StreamingResponse:
+    """
+    Streams every content of a project as newline-delimited JSON, ordered by id.
+    Requires a moderator or an export API key passed as X-API-Key.
+    """
+    return StreamingResponse(
+        iterate_export(project, after, include_data),
+        media_type="application/x-ndjson",
+    )
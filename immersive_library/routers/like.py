@@ -1,10 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException
 
+from immersive_library.changes import record_change
 from immersive_library.common import database
 from immersive_library.models import (
     Error,
     PlainSuccess,
 )
+from immersive_library.routers.manifest import invalidate_manifest
 from immersive_library.utils import (
     has_liked,
     logged_in_guard,
@@ -32,6 +34,8 @@ async def add_like(
     )
 
     await update_precomputation(database, contentid)
+    await record_change(database, contentid)
+    await invalidate_manifest(project, contentid)
 
     return PlainSuccess()
 
@@ -54,5 +58,7 @@ async def delete_like(
     )
 
     await update_precomputation(database, contentid)
+    await record_change(database, contentid)
+    await invalidate_manifest(project, contentid)
 
     return PlainSuccess()
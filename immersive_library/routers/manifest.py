@@ -0,0 +1,108 @@
+import asyncio
+import gzip
+import hashlib
+import os
+from typing import Optional
+
+from cachetools import LRUCache
+from fastapi import APIRouter, Header, Query
+from starlette.responses import Response
+
+from immersive_library.caching import RawJsonCoder, cache, invalidate
+from immersive_library.common import database
+from immersive_library.models import ManifestSuccess
+from immersive_library.utils import etag_matches
+
+router = APIRouter(tags=["Content"])
+
+# Content ids per shard, a change only invalidates the shard it falls into
+MANIFEST_SHARD_SIZE = int(os.getenv("MANIFEST_SHARD_SIZE", "16384"))
+
+# Shards are invalidated on change, this only bounds the damage of a lost invalidation
+MANIFEST_EXPIRE = 3600
+
+# Compressed manifests by ETag, local to this worker
+compressed_manifests: LRUCache[str, bytes] = LRUCache(maxsize=64)
+
+
+@cache(expire=MANIFEST_EXPIRE, coder=RawJsonCoder)
+async def get_manifest_shard(project: str, shard: int) -> bytes:
+    """
+    A JSON array of [contentid, version, likes] for one id range of a project
+    """
+    rows = await database.fetch_all(
+        """
+        SELECT c.oid, c.version, COALESCE(precomputation.likes, 0)
+        FROM content c
+            LEFT JOIN precomputation ON c.oid = precomputation.contentid
+        WHERE c.oid >= :start AND c.oid < :end AND c.project = :project
+        ORDER BY c.oid
+        """,
+        {
+            "project": project,
+            "start": shard * MANIFEST_SHARD_SIZE,
+            "end": (shard + 1) * MANIFEST_SHARD_SIZE,
+        },
+    )
+    return ("[" + ",".join(f"[{r[0]},{r[1]},{r[2]}]" for r in rows) + "]").encode()
+
+
+async def invalidate_manifest(project: str, contentid: int):
+    """
+    Call whenever a content is added, changed, liked or removed
+    """
+    await invalidate(
+        get_manifest_shard, project=project, shard=contentid // MANIFEST_SHARD_SIZE
+    )
+
+
+@router.get(
+    "/v2/manifest/{project}",
+    response_model=ManifestSuccess,
+    responses={304: {"description": "Not modified"}},
+)
+async def get_manifest(
+    project: str,
+    shard: Optional[int] = Query(
+        None,
+        ge=0,
+        description="Only include content ids from shard * shard_size up to, but excluding, (shard + 1) * shard_size.",
+    ),
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+) -> Response:
+    """
+    The contentid, version and likes of every content, to sync a local cache in one request.
+    Revalidate with If-None-Match, an unchanged manifest returns 304.
+    """
+    if shard is None:
+        last = await database.fetch_val("SELECT max(oid) FROM content")
+        shards = range((last or 0) // MANIFEST_SHARD_SIZE + 1)
+    else:
+        shards = [shard]
+
+    parts = await asyncio.gather(*[get_manifest_shard(project, s) for s in shards])
+    body = (
+        f'{{"shard_size":{MANIFEST_SHARD_SIZE},"contents":['.encode()
+        + b",".join(p[1:-1] for p in parts if p != b"[]")
+        + b"]}"
+    )
+
+    etag = f'"{hashlib.md5(body).hexdigest()}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    if "gzip" in (accept_encoding or ""):
+        compressed = compressed_manifests.get(etag)
+        if compressed is None:
+            compressed = await asyncio.to_thread(gzip.compress, body, 9)
+            compressed_manifests[etag] = compressed
+        headers["Content-Encoding"] = "gzip"
+        body = compressed
+
+    return Response(body, media_type="application/json", headers=headers)
@@ -1,6 +1,6 @@
 from fastapi import APIRouter
-from fastapi_cache.decorator import cache
 
+from immersive_library.caching import cache
 from immersive_library.common import database
 from immersive_library.routers.tag import list_project_tags
 
@@ -8,7 +8,7 @@ router = APIRouter()
 
 
 @router.get("/v1/stats/{project}")
-@cache(expire=60)
+@cache(expire=60, warm_up=True)
 async def get_statistics(project: str):
     content_count = await database.fetch_one(
         "SELECT count(*) from content WHERE project = :project", {"project": project}
@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException
 
+from immersive_library.changes import record_change
 from immersive_library.common import database, get_project
 from immersive_library.models import (
     Error,
@@ -37,6 +38,7 @@ async def add_report(
     await get_project(project).call("post_report", database, userid, contentid, reason)
 
     await update_precomputation(database, contentid)
+    await record_change(database, contentid)
 
     return PlainSuccess()
 
@@ -62,5 +64,6 @@ async def delete_report(
     )
 
     await update_precomputation(database, contentid)
+    await record_change(database, contentid)
 
     return PlainSuccess()
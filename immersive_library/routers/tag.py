@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException
-from fastapi_cache.decorator import cache
 
+from immersive_library.caching import cache
+from immersive_library.changes import record_change
 from immersive_library.common import database
 from immersive_library.models import (
     Error,
@@ -18,7 +19,7 @@ router = APIRouter(tags=["Tags"])
 
 
 @router.get("/v1/tag/{project}", response_model=TagDictSuccess)
-@cache(expire=60)
+@cache(expire=60, warm_up=True)
 async def list_project_tags(
     project: str, limit: int = 100, offset: int = 0
 ) -> TagDictSuccess:
@@ -71,6 +72,7 @@ async def add_tag(
     )
 
     await update_precomputation(database, contentid)
+    await record_change(database, contentid)
 
     return PlainSuccess()
 
@@ -94,5 +96,6 @@ async def delete_tag(
     )
 
     await update_precomputation(database, contentid)
+    await record_change(database, contentid)
 
     return PlainSuccess()
@@ -11,25 +11,33 @@ from immersive_library.utils import (
 
 router = APIRouter(tags=["Admin"])
 
+# Contents post-processed at once when re-checking a whole project
+POST_PROCESS_BATCH_SIZE = 256
+
 
 @router.get("/v1/tools/post-process/{project}", responses={401: {"model": Error}})
 async def run_post_upload_callbacks(
     project: str, userid: int = Depends(moderator_guard)
 ) -> PlainTextResponse:
-    content = await database.fetch_all(
-        "SELECT oid FROM content WHERE project=:project",
-        {"project": project},
-    )
+    contentids = [
+        row["oid"]
+        for row in await database.fetch_all(
+            "SELECT oid FROM content WHERE project=:project",
+            {"project": project},
+        )
+    ]
 
-    # Call validators for eventual post-processing
+    # Call validators for eventual post-processing, a batch at a time
     log = []
-    for c in content:
-        for message in await get_project(project).call(
-            "post_upload", database, userid, c["oid"]
+    for start in range(0, len(contentids), POST_PROCESS_BATCH_SIZE):
+        batch = contentids[start : start + POST_PROCESS_BATCH_SIZE]
+        for messages in await get_project(project).call(
+            "post_upload_batch", database, userid, batch
         ):
-            if message is not None:
-                print(message)
-                log.append(message)
+            for message in messages:
+                if message is not None:
+                    print(message)
+                    log.append(message)
 
     return PlainTextResponse(
         content="\n".join(log),
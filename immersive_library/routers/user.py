@@ -3,8 +3,9 @@ from typing import List, Optional
 
 from databases.interfaces import Record
 from fastapi import APIRouter, Depends, HTTPException
-from fastapi_cache.decorator import cache
 
+from immersive_library.caching import cache
+from immersive_library.changes import record_change
 from immersive_library.common import database
 from immersive_library.models import (
     BanEntry,
@@ -13,11 +14,13 @@ from immersive_library.models import (
     PlainSuccess,
     UserListSuccess,
 )
+from immersive_library.routers.manifest import invalidate_manifest
 from immersive_library.utils import (
     get_lite_user_class,
     moderator_guard,
     set_banned,
     set_moderator,
+    update_precomputation,
     user_exists,
 )
 
@@ -46,7 +49,7 @@ class UserOrder(str, Enum):
 
 
 @router.get("/v1/user/{project}", tags=["Users"], response_model=UserListSuccess)
-@cache(expire=60)
+@cache(expire=60, warm_up=True)
 async def get_users(
     project: str,
     limit: int = 100,
@@ -149,11 +152,37 @@ async def set_user(
 
     # Delete the user's content
     if purge:
-        await database.execute(
-            "DELETE FROM content WHERE userid=:userid", {"userid": userid}
+        contents = await database.fetch_all(
+            "SELECT oid, project FROM content WHERE userid=:userid", {"userid": userid}
         )
-        await database.execute(
-            "DELETE FROM likes WHERE userid=:userid", {"userid": userid}
+        liked = await database.fetch_all(
+            """
+            SELECT c.oid, c.project FROM likes
+                INNER JOIN content c ON c.oid = likes.contentid
+            WHERE likes.userid = :userid AND c.userid != :userid
+            """,
+            {"userid": userid},
         )
 
+        # The tombstones and the deletion become visible together, like a regular deletion
+        async with database.transaction():
+            for content in contents:
+                await record_change(database, content["oid"], deleted=True)
+
+            await database.execute(
+                "DELETE FROM content WHERE userid=:userid", {"userid": userid}
+            )
+            await database.execute(
+                "DELETE FROM likes WHERE userid=:userid", {"userid": userid}
+            )
+
+        for content in contents:
+            await invalidate_manifest(content["project"], content["oid"])
+
+        # The content the user liked lost a like
+        for content in liked:
+            await update_precomputation(database, content["oid"])
+            await record_change(database, content["oid"])
+            await invalidate_manifest(content["project"], content["oid"])
+
     return PlainSuccess()
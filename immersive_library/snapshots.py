@@ -0,0 +1,164 @@
+import asyncio
+import gzip
+import hashlib
+import logging
+import os
+import tempfile
+import time
+import uuid
+from typing import Optional
+
+import orjson
+from fastapi_cache import FastAPICache
+
+from immersive_library import caching
+from immersive_library.changes import get_latest_change
+from immersive_library.common import get_project, projects
+from immersive_library.routers.content import list_content_page, normalize_terms
+
+logger = logging.getLogger(__name__)
+
+# Where pre-rendered pages of the deprecated content list are kept, shared by all workers
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "data/snapshots")
+
+# How often projects are checked for changes, the most a snapshot lags behind
+SNAPSHOT_INTERVAL = int(os.getenv("SNAPSHOT_INTERVAL", "60"))
+
+# Bans and renames do not show up in the change log, re-render at least this often
+SNAPSHOT_MAX_AGE = int(os.getenv("SNAPSHOT_MAX_AGE", "3600"))
+
+# Upper bound for rendering a project's snapshots, after which another worker may take over
+SNAPSHOT_TIMEOUT = 600
+
+LEGACY_LIST_LIMIT = 500
+
+
+def get_legacy_whitelist(
+    tag_filter: Optional[str] = None, invert_filter: bool = False
+) -> Optional[str]:
+    """
+    The whitelist equivalent to the deprecated list parameters
+    """
+    return normalize_terms(
+        None if invert_filter else tag_filter,
+        tag_filter if invert_filter else None,
+    )
+
+
+def get_snapshot_path(project: str, whitelist: Optional[str]) -> str:
+    key = hashlib.md5((whitelist or "").encode()).hexdigest()[:16]
+    return os.path.join(SNAPSHOT_DIR, f"{project}-{key}.json")
+
+
+def get_snapshot(project: str, whitelist: Optional[str]) -> Optional[str]:
+    """
+    The path of a snapshot, None if the parameters are not pre-rendered for that project
+    """
+    declared = {get_legacy_whitelist(**p) for p in get_project(project).snapshots}
+    if project not in projects or whitelist not in declared:
+        return None
+    path = get_snapshot_path(project, whitelist)
+    return path if os.path.exists(path) else None
+
+
+def write_atomically(path: str, data: bytes):
+    """
+    Writes through a temporary file unique to the writer, so readers never see a partial file
+    """
+    fd, temporary_path = tempfile.mkstemp(
+        dir=os.path.dirname(path), prefix=os.path.basename(path) + ".", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(temporary_path, 0o644)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+
+def write_snapshot(path: str, page: bytes):
+    """
+    Writes the page next to a gzipped copy, each replaced atomically
+    """
+    # The gzipped copy goes first, once the page exists both can be served
+    write_atomically(path + ".gz", gzip.compress(page, 9))
+    write_atomically(path, page)
+
+
+def get_state(project: str, seq: Optional[int]) -> str:
+    """
+    What the snapshots of a project have been rendered from
+    """
+    whitelists = sorted(
+        get_legacy_whitelist(**p) or "" for p in projects[project].snapshots
+    )
+    return orjson.dumps([seq, whitelists]).decode()
+
+
+async def render_snapshots(project: str, state: str):
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    for parameters in projects[project].snapshots:
+        whitelist = get_legacy_whitelist(**parameters)
+        page = await list_content_page.__wrapped__(
+            project, whitelist=whitelist, limit=LEGACY_LIST_LIMIT
+        )
+        await asyncio.to_thread(
+            write_snapshot, get_snapshot_path(project, whitelist), page
+        )
+
+    # Written last, an interrupted run is repeated
+    await asyncio.to_thread(
+        write_atomically,
+        os.path.join(SNAPSHOT_DIR, f"{project}.state"),
+        state.encode(),
+    )
+
+
+async def update_snapshots():
+    """
+    Re-renders the snapshots of every project which changed since
+    """
+    backend = FastAPICache.get_backend()
+    for project in projects:
+        state = get_state(project, await get_latest_change(project))
+        path = os.path.join(SNAPSHOT_DIR, f"{project}.state")
+        try:
+            with open(path) as f:
+                if (
+                    f.read() == state
+                    and time.time() - os.path.getmtime(path) < SNAPSHOT_MAX_AGE
+                ):
+                    continue
+        except FileNotFoundError:
+            pass
+
+        key = f"{FastAPICache.get_prefix()}:snapshots:{project}"
+        token = uuid.uuid4().hex
+        if not await caching.acquire_lock(backend, key, token, SNAPSHOT_TIMEOUT):
+            continue
+        try:
+            # The Redis lock lets everyone through while Redis is down, the file lock does not
+            os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+            with caching.file_lock(
+                os.path.join(SNAPSHOT_DIR, f"{project}.lock")
+            ) as locked:
+                if locked:
+                    await render_snapshots(project, state)
+        except Exception:
+            logger.warning(f"Error rendering snapshots of '{project}':", exc_info=True)
+        finally:
+            await caching.release_lock(backend, key, token)
+
+
+async def run():
+    """
+    Keeps the snapshots in sync with their projects
+    """
+    while True:
+        try:
+            await update_snapshots()
+        except Exception:
+            logger.warning("Error updating snapshots:", exc_info=True)
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
@@ -5,10 +5,29 @@ from databases import Database
 from PIL import Image
 
 from immersive_library.models import ContentUpload
-from immersive_library.validators.validator import Validator
+from immersive_library.validators.validator import Validator, blocking
+
+# zlib level for normalized PNGs, higher levels cost several times the latency for ~2% smaller skins
+PNG_COMPRESS_LEVEL = 6
+
+
+def decode_image(payload: bytes) -> Image.Image:
+    image = Image.open(io.BytesIO(payload))
+    image.load()
+    return image
+
+
+def get_image(content: ContentUpload) -> Image.Image:
+    """
+    The uploaded image, decoded once per upload and shared between validators
+    """
+    return content.get_artifact("image", decode_image)
 
 
 class ImageValidator(Validator):
+    # Replaces the uploaded data
+    exclusive = True
+
     def __init__(
         self,
         width: Optional[int] = None,
@@ -29,12 +48,26 @@ class ImageValidator(Validator):
         self.file_format = file_format
         self.image_mode = image_mode
 
-    async def pre_upload(
+    def normalize(self, image: Image.Image) -> bytes:
+        """
+        Re-encodes the image in the target mode, stripping metadata by copying only the pixel buffer
+        """
+        converted = image.convert(self.image_mode)
+        clean = Image.frombytes(self.image_mode, converted.size, converted.tobytes())
+        output = io.BytesIO()
+        options = {}
+        if self.file_format.lower() == "png":
+            options["compress_level"] = PNG_COMPRESS_LEVEL
+        clean.save(output, format=self.file_format, **options)
+        return output.getvalue()
+
+    @blocking
+    def pre_upload(
         self, database: Database, userid: int, content: ContentUpload
     ) -> Optional[str]:
         # noinspection PyBroadException
         try:
-            image = Image.open(io.BytesIO(content.payload))
+            image = get_image(content)
 
             # Check the image format
             if image.format.lower() != self.file_format.lower():
@@ -49,14 +82,7 @@ class ImageValidator(Validator):
             ):
                 return "invalid dimensions"
 
-            # Strip metadata and save
-            output = io.BytesIO()
-            image2 = Image.new(self.image_mode, image.size)
-            # noinspection PyTypeChecker
-            image2.putdata(list(image.getdata()))
-            image2.save(output, format=self.file_format)
-            output.seek(0)
-            content.replace(output.read())
+            content.replace(self.normalize(image))
 
         except Exception:
             return "invalid image"
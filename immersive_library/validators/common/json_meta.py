@@ -20,6 +20,6 @@ class JsonMetaValidator(Validator):
         self, database: Database, userid: int, content: ContentUpload
     ) -> Optional[str]:
         try:
-            self.schema.model_validate(content.meta)
+            self.schema.model_validate_json(content.meta)
         except ValidationError as e:
             return str(e)
@@ -15,9 +15,13 @@ class MaxSizeValidator(Validator):
 
         self.max_size = max_size
 
+    @property
+    def max_upload_size(self) -> int:
+        return self.max_size
+
     async def pre_upload(
         self, database: Database, userid: int, content: ContentUpload
     ) -> Optional[str]:
-        if len(content.data) > self.max_size * 1.33:
+        if len(content.payload) > self.max_size:
             return "data too large"
         return None
@@ -1,14 +1,17 @@
 import io
-from typing import Optional
+from typing import List, Optional, Tuple
 
 import numpy as np
+import orjson
 import PIL
 from databases import Database
 from PIL import Image
 
+from immersive_library.changes import record_change
 from immersive_library.models import ContentUpload
-from immersive_library.utils import has_tag
-from immersive_library.validators.validator import Validator
+from immersive_library.utils import update_precomputation
+from immersive_library.validators.common.image import get_image
+from immersive_library.validators.validator import Validator, blocking
 
 
 def get_mask(path: str):
@@ -22,57 +25,108 @@ clothing_threshold = 0
 hair_threshold = 6
 
 
+def decode_skin(data: Optional[bytes]) -> Optional[np.ndarray]:
+    """
+    The RGBA pixels of a skin, None if it is not a valid 64x64 image
+    """
+    if data is None:
+        return None
+    try:
+        image = np.array(Image.open(io.BytesIO(data)).convert("RGBA"))
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    return image if image.shape == (64, 64, 4) else None
+
+
 class ValidClothingValidator(Validator):
-    async def pre_upload(
+    @blocking
+    def pre_upload(
         self, database: Database, userid: int, content: ContentUpload
     ) -> Optional[str]:
         try:
-            image = Image.open(io.BytesIO(content.payload))
-            image = np.array(image.convert("RGBA"))
+            image = np.array(get_image(content).convert("RGBA"))
 
             if image.shape != (64, 64, 4):
                 return "Shape is not (64, 64, 4)!"
         except PIL.UnidentifiedImageError:
             return "Not an valid image!"
 
-    async def post_upload(
-        self, database: Database, userid: int, contentid: int
-    ) -> Optional[str]:
+    @blocking
+    def get_transparencies(
+        self, blobs: List[Optional[bytes]]
+    ) -> List[Optional[Tuple[int, int]]]:
         """
-        Mark skins as invalid if several pixels which are expected to be transparent are not.
+        The number of transparent pixels in the clothing and head areas of each skin, None for invalid skins.
+        The skins are stacked and counted in one vectorized pass.
         """
-        content = await database.fetch_one(
-            "SELECT data FROM content WHERE oid=:contentid",
-            {"contentid": contentid},
-        )
-
-        if content is None:
-            return None
-
-        image = Image.open(io.BytesIO(content[0]))
-        image = np.array(image.convert("RGBA"))
+        skins = [decode_skin(data) for data in blobs]
+        valid = [i for i, skin in enumerate(skins) if skin is not None]
+        if not valid:
+            return [None] * len(blobs)
 
-        clothing_alpha = ((image[:, :, 3] < 128) * clothing_mask).sum()
+        alpha = np.stack([skins[i] for i in valid])[:, :, :, 3]
+        clothing_alpha = ((alpha < 128) * clothing_mask).sum(axis=(1, 2))
         head_alpha = (
-            ((image[:32, :32, 3] + image[:32, 32:, 3]) < 128) * head_mask[:32, :32]
-        ).sum()
+            ((alpha[:, :32, :32] + alpha[:, :32, 32:]) < 128) * head_mask[:32, :32]
+        ).sum(axis=(1, 2))
 
-        is_hair = await has_tag(database, contentid, "hair")
+        transparencies: List[Optional[Tuple[int, int]]] = [None] * len(blobs)
+        for i, clothing, head in zip(valid, clothing_alpha, head_alpha):
+            transparencies[i] = (int(clothing), int(head))
+        return transparencies
 
-        seems_invalid = (
-            clothing_alpha < clothing_threshold and not is_hair
-        ) or head_alpha < hair_threshold
+    async def post_upload(
+        self, database: Database, userid: int, contentid: int
+    ) -> Optional[str]:
+        return (await self.post_upload_batch(database, userid, [contentid]))[0]
 
-        is_invalid = await has_tag(database, contentid, "invalid")
+    async def post_upload_batch(
+        self, database: Database, userid: int, contentids: List[int]
+    ) -> List[Optional[str]]:
+        """
+        Mark skins as invalid if several pixels which are expected to be transparent are not.
+        """
+        rows = await database.fetch_all(
+            """
+            SELECT c.oid, c.data,
+                EXISTS (SELECT 1 FROM tags WHERE tags.contentid = c.oid AND tags.tag = 'hair') AS is_hair,
+                EXISTS (SELECT 1 FROM tags WHERE tags.contentid = c.oid AND tags.tag = 'invalid') AS is_invalid
+            FROM content c
+            WHERE c.oid IN (SELECT value FROM json_each(:contentids))
+            """,
+            {"contentids": orjson.dumps(contentids).decode()},
+        )
+        transparencies = await self.get_transparencies([row["data"] for row in rows])
+
+        messages = {}
+        newly_invalid = []
+        for row, transparency in zip(rows, transparencies):
+            if transparency is None:
+                continue
+            clothing_alpha, head_alpha = transparency
+
+            seems_invalid = (
+                clothing_alpha < clothing_threshold and not row["is_hair"]
+            ) or head_alpha < hair_threshold
+
+            if seems_invalid:
+                if not row["is_invalid"]:
+                    newly_invalid.append({"contentid": row["oid"], "tag": "invalid"})
+                    messages[row["oid"]] = f"{row['oid']} has been marked as invalid!"
+            elif row["is_invalid"]:
+                messages[row["oid"]] = (
+                    f"{row['oid']} seems valid but was marked as invalid!"
+                )
 
-        if seems_invalid:
-            if not is_invalid:
-                await database.execute(
+        if newly_invalid:
+            async with database.transaction():
+                await database.execute_many(
                     "INSERT INTO tags (contentid, tag) VALUES(:contentid, :tag)",
-                    {"contentid": contentid, "tag": "invalid"},
+                    newly_invalid,
                 )
-                return f"{contentid} has been marked as invalid!"
-        else:
-            if is_invalid:
-                return f"{contentid} seems valid but was marked as invalid!"
-        return None
+
+            for tag in newly_invalid:
+                await update_precomputation(database, tag["contentid"])
+                await record_change(database, tag["contentid"])
+
+        return [messages.get(contentid) for contentid in contentids]
@@ -1,11 +1,42 @@
-from typing import Optional
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
 
 from databases import Database
 
 from immersive_library.models import ContentUpload
 
+# Threads shared by all CPU-bound validators, bounding how many uploads are decoded at once
+VALIDATOR_THREADS = int(
+    os.getenv("VALIDATOR_THREADS", str(min(4, os.cpu_count() or 1)))
+)
+
+executor = ThreadPoolExecutor(VALIDATOR_THREADS, thread_name_prefix="validator")
+
+
+def blocking(function: Callable) -> Callable:
+    """
+    Declares a synchronous, CPU-bound validator method, which is run in the validator pool instead of the event loop
+    """
+
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(
+            executor, functools.partial(function, *args, **kwargs)
+        )
+
+    return wrapper
+
 
 class Validator:
+    # The largest payload in bytes this validator accepts, uploads exceeding it are rejected while streaming
+    max_upload_size: Optional[int] = None
+
+    # Whether the validator changes the content other validators see, such validators run alone
+    exclusive: bool = False
+
     async def pre_upload(
         self, database: Database, userid: int, content: ContentUpload
     ) -> Optional[str]:
@@ -16,6 +47,18 @@ class Validator:
     ) -> Optional[str]:
         pass
 
+    async def post_upload_batch(
+        self, database: Database, userid: int, contentids: List[int]
+    ) -> List[Optional[str]]:
+        """
+        Post-processes several contents at once, e.g. when re-checking a whole project.
+        Calls post_upload for each unless overridden with a faster version.
+        """
+        return [
+            await self.post_upload(database, userid, contentid)
+            for contentid in contentids
+        ]
+
     async def pre_report(
         self, database: Database, userid: int, contentid: int, reason: str
     ):
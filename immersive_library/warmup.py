@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import os
+import uuid
+from typing import Any
+
+import orjson
+from fastapi_cache import FastAPICache
+
+from immersive_library import caching
+from immersive_library.common import projects
+from immersive_library.metrics import (
+    WARMUP_KEYS,
+    WARMUP_PENDING,
+    WARMUP_RUNS,
+)
+
+logger = logging.getLogger(__name__)
+
+# How many of the most requested keys are precomputed per run
+WARMUP_LIMIT = int(os.getenv("WARMUP_LIMIT", "50"))
+
+# Pause between two precomputed keys, so live traffic keeps priority
+WARMUP_DELAY = float(os.getenv("WARMUP_DELAY", "0.25"))
+
+# How often request counts are flushed and the cache is checked for a flush
+WARMUP_CHECK_INTERVAL = int(os.getenv("WARMUP_CHECK_INTERVAL", "60"))
+
+# Upper bound for a single run, after which another worker may take over
+WARMUP_TIMEOUT = 600
+
+# Weight of previous request counts on each flush, older traffic fades out
+TRAFFIC_DECAY = 0.5
+TRAFFIC_KEEP = 1000
+
+
+def get_key(name: str) -> str:
+    return f"{FastAPICache.get_prefix()}:warmup:{name}"
+
+
+def declared_requests() -> list[tuple[str, dict[str, Any]]]:
+    """
+    Return the warm-up requests declared by each project
+    """
+    return [
+        (endpoint, {**parameters, "project": name})
+        for name, project in projects.items()
+        for endpoint, parameters in project.warm_up_requests
+    ]
+
+
+async def learned_requests() -> list[tuple[str, dict[str, Any]]]:
+    """
+    Return the most requested public keys, as flushed by all workers
+    """
+    backend = FastAPICache.get_backend()
+    if not hasattr(backend, "top_traffic"):
+        return []
+    requests = []
+    for member in await backend.top_traffic(get_key("traffic"), WARMUP_LIMIT):
+        endpoint, parameters = orjson.loads(member)
+        if endpoint in caching.endpoints:
+            requests.append((endpoint, parameters))
+    return requests
+
+
+async def flush_traffic():
+    """
+    Moves this worker's request counts into the shared traffic ranking
+    """
+    backend = FastAPICache.get_backend()
+    counts = caching.traffic.copy()
+    caching.traffic.clear()
+    if not counts or not hasattr(backend, "record_traffic"):
+        return
+    members = {
+        orjson.dumps([endpoint, orjson.loads(parameters)]): count
+        for (endpoint, parameters), count in counts.items()
+    }
+    await backend.record_traffic(
+        get_key("traffic"), members, TRAFFIC_DECAY, TRAFFIC_KEEP
+    )
+
+
+async def warm_up(reason: str):
+    """
+    Precomputes declared and popular keys, one at a time
+    :param reason: Why the warm-up runs, used as metric label
+    """
+    backend = FastAPICache.get_backend()
+    token = uuid.uuid4().hex
+    lock = get_key("run")
+    if not await caching.acquire_lock(backend, lock, token, WARMUP_TIMEOUT):
+        return
+
+    try:
+        requests = []
+        seen = set()
+        for endpoint, parameters in declared_requests() + await learned_requests():
+            identifier = orjson.dumps(
+                [endpoint, parameters], option=orjson.OPT_SORT_KEYS
+            )
+            if identifier not in seen:
+                seen.add(identifier)
+                requests.append((endpoint, parameters))
+        requests = requests[:WARMUP_LIMIT]
+
+        WARMUP_RUNS.labels(reason).inc()
+        WARMUP_PENDING.set(len(requests))
+        for endpoint, parameters in requests:
+            try:
+                await caching.call_endpoint(endpoint, parameters)
+                WARMUP_KEYS.labels("success").inc()
+            except Exception:
+                logger.warning(f"Error warming up {endpoint}:", exc_info=True)
+                WARMUP_KEYS.labels("error").inc()
+            WARMUP_PENDING.dec()
+            await asyncio.sleep(WARMUP_DELAY)
+
+        await backend.set(get_key("sentinel"), b"1")
+    finally:
+        WARMUP_PENDING.set(0)
+        await caching.release_lock(backend, lock, token)
+
+
+async def run():
+    """
+    Warms up after startup, and again whenever the cache has been flushed
+    """
+    try:
+        await warm_up("startup")
+    except Exception:
+        logger.warning("Error warming up cache:", exc_info=True)
+
+    while True:
+        await asyncio.sleep(WARMUP_CHECK_INTERVAL)
+        try:
+            await flush_traffic()
+
+            # The sentinel never expires, so if it is gone the cache has been flushed
+            if await FastAPICache.get_backend().get(get_key("sentinel")) is None:
+                await warm_up("invalidation")
+        except Exception:
+            logger.warning("Error warming up cache:", exc_info=True)
@@ -3,6 +3,16 @@ function getContainerElement(container) {
     return typeof container === 'string' ? document.getElementById(container) : container;
 }
 
+async function fetchContents(project, contentids) {
+    const res = await fetch(`/v2/content/${encodeURIComponent(project)}/batch?include_data=true`, {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({contentids}),
+    });
+    const contents = (await res.json()).contents;
+    return new Map(contents.map(content => [content.contentid, content]));
+}
+
 async function embedContent(container, project, content, options = {}) {
     if (typeof content === 'number') {
         const res = await fetch(`/v1/content/${project}/${content}`);